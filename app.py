@@ -1,6 +1,9 @@
+import json
 import os
+import uuid
+import click
 from dotenv import load_dotenv
-from flask import Flask, jsonify
+from flask import Flask, g, jsonify, request
 from flask_smorest import Api
 from flask_jwt_extended import JWTManager
 from routes.staff import blp as StaffBlueprint
@@ -8,7 +11,19 @@ from routes.student import blp as StudentBlueprint
 from routes.user import blp as UserBlueprint
 from routes.attendance import blp as AttendanceBlueprint
 from blocklist import BLOCKLIST
-from db import mongo
+from helper import lookup_role
+from passwords import PASSWORD_HASHER
+from attendance_buffer import ATTENDANCE_BUFFER
+from role_cache import ROLE_CACHE
+from response_cache import RESPONSE_CACHE, build_backend
+from db import mongo, client_options
+import metrics
+import attendance_store
+import attendance_export
+import attendance_summary
+import bulk_import
+from indexes import check_indexes, ensure_indexes, explain_stages, sync_indexes
+from routes.student import student_filter
 
 
 app = Flask(__name__)
@@ -27,13 +42,215 @@ app.config["OPENAPI_VERSION"] = "3.0.3"
 app.config["OPENAPI_URL_PREFIX"] = "/"
 app.config["OPENAPI_SWAGGER_UI_PATH"] = "/swagger-ui"
 app.config["OPENAPI_SWAGGER_UI_URL"] = "https://cdn.jsdelivr.net/npm/swagger-ui-dist/"
+app.config["PAGE_SIZE_DEFAULT"] = int(os.environ.get("PAGE_SIZE_DEFAULT", 50))
+app.config["PAGE_SIZE_MAX"] = int(os.environ.get("PAGE_SIZE_MAX", 500))
+app.config["STREAM_BATCH_SIZE"] = int(os.environ.get("STREAM_BATCH_SIZE", 1000))
+app.config["ROLE_CACHE_TTL"] = float(os.environ.get("ROLE_CACHE_TTL", 60))
+app.config["ROLE_CACHE_SIZE"] = int(os.environ.get("ROLE_CACHE_SIZE", 10000))
+# Put is_staff/is_admin in the access token so authorize() needs no lookup.
+# Role changes then only apply once the caller's token is reissued.
+app.config["ROLE_CLAIMS_IN_JWT"] = os.environ.get("ROLE_CLAIMS_IN_JWT", "0") == "1"
+ROLE_CACHE.configure(ttl=app.config["ROLE_CACHE_TTL"], maxsize=app.config["ROLE_CACHE_SIZE"])
+# Cache of list responses: "memory" (one worker), "shared" (SQLite file used by
+# every worker on the host) or "none". serve.py picks "shared" for several workers.
+app.config["RESPONSE_CACHE_BACKEND"] = os.environ.get("RESPONSE_CACHE_BACKEND", "memory")
+app.config["RESPONSE_CACHE_MAX_BYTES"] = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+app.config["RESPONSE_CACHE_PATH"] = os.environ.get("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+app.config["RESPONSE_CACHE_TTL"] = float(os.environ.get("RESPONSE_CACHE_TTL", 60))
+RESPONSE_CACHE.configure(
+    backend=build_backend(
+        app.config["RESPONSE_CACHE_BACKEND"], app.config["RESPONSE_CACHE_MAX_BYTES"], app.config["RESPONSE_CACHE_PATH"]
+    ),
+    ttl=app.config["RESPONSE_CACHE_TTL"],
+)
+# Role invalidations reach the other workers through the "shared" response
+# cache backend's generation counters. With any other backend they apply on
+# other workers after ROLE_CACHE_TTL, which serve.py then caps at 5 seconds.
+if RESPONSE_CACHE.backend is not None:
+    ROLE_CACHE.configure(shared=RESPONSE_CACHE.backend)
+# "daily" (one document per student per day) or "bucketed" (one per student per month).
+app.config["ATTENDANCE_STORAGE"] = os.environ.get("ATTENDANCE_STORAGE", "daily")
+# Write-behind mode of POST /attendance: records are queued and upserted in
+# batches every ATTENDANCE_BUFFER_INTERVAL_MS or ATTENDANCE_BUFFER_MAX_RECORDS
+# records. ATTENDANCE_BUFFER_DURABILITY is "flush" (respond once written) or
+# "enqueue" (respond 202 once queued).
+app.config["ATTENDANCE_BUFFER_ENABLED"] = os.environ.get("ATTENDANCE_BUFFER_ENABLED", "0") == "1"
+app.config["ATTENDANCE_BUFFER_MAX_RECORDS"] = int(os.environ.get("ATTENDANCE_BUFFER_MAX_RECORDS", 500))
+app.config["ATTENDANCE_BUFFER_INTERVAL_MS"] = float(os.environ.get("ATTENDANCE_BUFFER_INTERVAL_MS", 50))
+app.config["ATTENDANCE_BUFFER_MAX_QUEUE"] = int(os.environ.get("ATTENDANCE_BUFFER_MAX_QUEUE", 10000))
+app.config["ATTENDANCE_BUFFER_DURABILITY"] = os.environ.get("ATTENDANCE_BUFFER_DURABILITY", "flush")
+ATTENDANCE_BUFFER.configure(
+    enabled=app.config["ATTENDANCE_BUFFER_ENABLED"],
+    max_records=app.config["ATTENDANCE_BUFFER_MAX_RECORDS"],
+    interval_ms=app.config["ATTENDANCE_BUFFER_INTERVAL_MS"],
+    max_queue=app.config["ATTENDANCE_BUFFER_MAX_QUEUE"],
+    durability=app.config["ATTENDANCE_BUFFER_DURABILITY"],
+    app=app,
+)
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+app.config["PASSWORD_HASH_EXECUTOR"] = os.environ.get("PASSWORD_HASH_EXECUTOR", "process")
+app.config["PASSWORD_HASH_MAX_PENDING"] = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 32))
+app.config["PASSWORD_HASH_ROUNDS"] = int(os.environ.get("PASSWORD_HASH_ROUNDS", 29000))
+PASSWORD_HASHER.configure(
+    workers=app.config["PASSWORD_HASH_WORKERS"],
+    max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+    rounds=app.config["PASSWORD_HASH_ROUNDS"],
+    executor=app.config["PASSWORD_HASH_EXECUTOR"],
+)
+# Rows validated, hashed and inserted together by the bulk student/staff import.
+app.config["IMPORT_CHUNK_SIZE"] = int(os.environ.get("IMPORT_CHUNK_SIZE", 500))
+# Students whose attendance is fetched per query, and rows per Parquet row group, in exports.
+app.config["EXPORT_CHUNK_SIZE"] = int(os.environ.get("EXPORT_CHUNK_SIZE", 1000))
+app.config["EXPORT_ROW_GROUP_SIZE"] = int(os.environ.get("EXPORT_ROW_GROUP_SIZE", 50000))
+# Spend refresh tokens on use and revoke the whole family when one is replayed.
+app.config["REFRESH_TOKEN_ROTATION"] = os.environ.get("REFRESH_TOKEN_ROTATION", "1") == "1"
+app.config["BLOCKLIST_REFRESH_SECONDS"] = float(os.environ.get("BLOCKLIST_REFRESH_SECONDS", 5))
+app.config["BLOCKLIST_REBUILD_SECONDS"] = float(os.environ.get("BLOCKLIST_REBUILD_SECONDS", 3600))
+app.config["BLOCKLIST_BLOOM_CAPACITY"] = int(os.environ.get("BLOCKLIST_BLOOM_CAPACITY", 100000))
+app.config["BLOCKLIST_SYNC_OVERLAP_SECONDS"] = float(os.environ.get("BLOCKLIST_SYNC_OVERLAP_SECONDS", 5))
+BLOCKLIST.configure(
+    refresh_interval=app.config["BLOCKLIST_REFRESH_SECONDS"],
+    rebuild_interval=app.config["BLOCKLIST_REBUILD_SECONDS"],
+    capacity=app.config["BLOCKLIST_BLOOM_CAPACITY"],
+    sync_overlap=app.config["BLOCKLIST_SYNC_OVERLAP_SECONDS"],
+)
 app.config["MONGO_URI"] =  os.environ.get("MONGO_URL")
+# Pool sizes should follow the server's concurrency; serve.py sets
+# MONGO_MAX_POOL_SIZE from it unless it is given explicitly.
+app.config["MONGO_MAX_POOL_SIZE"] = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))
+app.config["MONGO_MIN_POOL_SIZE"] = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+app.config["MONGO_WAIT_QUEUE_TIMEOUT_MS"] = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+app.config["MONGO_SERVER_SELECTION_TIMEOUT_MS"] = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 30000))
+# Request latency and MongoDB command metrics, served at /metrics.
+app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "1") == "1"
+# Log requests slower than this many milliseconds; 0 disables the slow-request log.
+app.config["SLOW_REQUEST_MS"] = float(os.environ.get("SLOW_REQUEST_MS", 0))
 print(app.config["MONGO_URI"])
-mongo.init_app(app)
+mongo.init_app(app, **client_options(app.config))
+
+if os.environ.get("CREATE_INDEXES_ON_STARTUP", "1") == "1":
+    sync_indexes(mongo.db)
+
+
+@app.cli.command("create-indexes")
+def create_indexes_command():
+    """Create the declared MongoDB indexes."""
+    for collection, names in ensure_indexes(mongo.db).items():
+        print(f"{collection}: {', '.join(names)}")
+
+
+@app.cli.command("check-indexes")
+def check_indexes_command():
+    """Report drift between the declared and the existing MongoDB indexes."""
+    drift = check_indexes(mongo.db)
+    if not drift:
+        print("Indexes match the declared registry.")
+    for collection, report in drift.items():
+        print(f"{collection}: {report}")
+    raise SystemExit(1 if drift else 0)
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Explain the GET /student filters and fail unless each uses its filter index."""
+    sample = mongo.db.students.find_one({}, {"dept": 1, "batch": 1, "sem": 1, "name": 1}) or {}
+    dept, batch, sem = sample.get("dept", "CSE"), sample.get("batch", 2024), sample.get("sem", 1)
+    # Filter -> the index its winning plan must scan.
+    filters = [
+        ({"dept": dept}, "dept_batch_sem_id"),
+        ({"dept": dept, "batch": batch}, "dept_batch_sem_id"),
+        ({"dept": dept, "batch": batch, "sem": sem}, "dept_batch_sem_id"),
+        ({"name": sample.get("name", "A")[:3]}, "name_id"),
+    ]
+    failures = 0
+    for args, expected in filters:
+        # The same shape as a GET /student page: keyset order on _id, limit + 1.
+        cursor = mongo.db.students.find(student_filter(args)).sort("_id", 1).limit(app.config["PAGE_SIZE_DEFAULT"] + 1)
+        stages = explain_stages(cursor)
+        ok = ("IXSCAN", expected) in stages and not any(stage == "COLLSCAN" for stage, _ in stages)
+        failures += not ok
+        plan = " <- ".join(f"{stage}({index})" if index else stage for stage, index in stages)
+        print(f"{'ok' if ok else 'FAIL'} {args}: {plan}, expected IXSCAN({expected})")
+    raise SystemExit(1 if failures else 0)
+
+
+@app.cli.command("rebuild-attendance-summary")
+def rebuild_attendance_summary_command():
+    """Recompute the attendance summaries from the raw attendance rows.
+
+    Stop attendance writes first: counters updated while the rebuild runs are
+    overwritten when the rebuilt collection is swapped in.
+    """
+    count = attendance_summary.rebuild(mongo.db, app.config["ATTENDANCE_STORAGE"])
+    print(f"Wrote {count} summary documents.")
+
+
+@app.cli.command("migrate-attendance")
+@click.argument("target", type=click.Choice(list(attendance_store.STORES)))
+def migrate_attendance_command(target):
+    """Copy attendance records into the TARGET storage layout."""
+    written = attendance_store.migrate(mongo.db, target)
+    print(f"Wrote {written} documents in the {target} layout. Set ATTENDANCE_STORAGE={target} to switch.")
+
+
+@app.cli.command("import-members")
+@click.argument("kind", type=click.Choice(list(bulk_import.KINDS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(bulk_import.FORMATS), help="Defaults to the file extension.")
+def import_members_command(kind, path, fmt):
+    """Register students or staff from a CSV or NDJSON file at PATH."""
+    with open(path, "rb") as f:
+        rows = bulk_import.read_rows(f, fmt or bulk_import.detect_format(path))
+        report = bulk_import.import_members(mongo.db, kind, rows, app.config["IMPORT_CHUNK_SIZE"])
+    for error in report.pop("errors"):
+        print(json.dumps(error))
+    print(report)
+    raise SystemExit(1 if report["invalid"] or report["duplicate"] or report["error"] else 0)
+
+
+@app.cli.command("export-attendance")
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option("--dept")
+@click.option("--batch", type=int)
+@click.option("--sem", type=int)
+@click.option("--from", "start", type=click.DateTime(["%d-%m-%Y"]), help="First day, DD-MM-YYYY.")
+@click.option("--to", "end", type=click.DateTime(["%d-%m-%Y"]), help="Last day, DD-MM-YYYY.")
+@click.option("--fields", default=",".join(attendance_export.DEFAULT_FIELDS), show_default=True)
+@click.option("--format", "fmt", type=click.Choice(attendance_export.FORMATS), help="Defaults to the OUTPUT extension.")
+def export_attendance_command(output, dept, batch, sem, start, end, fields, fmt):
+    """Write the attendance of a cohort over a date range to OUTPUT."""
+    fmt = fmt or ("parquet" if output.endswith(".parquet") else "csv")
+    columns = tuple(column.strip() for column in fields.split(","))
+    unknown = [column for column in columns if column not in attendance_export.FIELDS]
+    if unknown:
+        raise click.BadParameter(f"unknown fields {unknown}", param_hint="--fields")
+    cohort = {key: value for key, value in (("dept", dept), ("batch", batch), ("sem", sem)) if value is not None}
+    store = attendance_store.STORES[app.config["ATTENDANCE_STORAGE"]](mongo.db)
+    rows = attendance_export.export_rows(mongo.db, store, cohort, start, end, columns, app.config["EXPORT_CHUNK_SIZE"])
+    with open(output, "w" if fmt == "csv" else "wb", newline="" if fmt == "csv" else None) as f:
+        for chunk in attendance_export.encode(rows, columns, fmt, app.config["EXPORT_ROW_GROUP_SIZE"]):
+            f.write(chunk)
+    print(f"Wrote {output}.")
 
 
 api = Api(app)
 
+if app.config["METRICS_ENABLED"]:
+    # Registered first so its after_request hook runs last and times the whole request.
+    metrics.init_app(app)
+
+
+@app.before_request
+def assign_request_id():
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+
+
+@app.after_request
+def add_request_id_header(response):
+    if "request_id" in g:
+        response.headers["X-Request-ID"] = g.request_id
+    return response
+
 app.config["JWT_SECRET_KEY"]= "'9d6fce3c348e400cea42a0d9cbe727404c4835d53ac277111b2999bdd91c28ed9c5e52fc499843f800790d7954222f5e989011740540dfee22a0a67423d89e57"
 jwt = JWTManager(app)
 
@@ -52,6 +269,8 @@ def revoked_token_callback(jwt_header, jwt_payload):
     )
 @jwt.additional_claims_loader
 def add_claims_to_jwt(identity):
+    if app.config["ROLE_CLAIMS_IN_JWT"]:
+        return lookup_role(identity)
     if identity == 1:
         return {"is_admin": True}
     return {"is_admin": False}
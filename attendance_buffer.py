@@ -0,0 +1,182 @@
+import atexit
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from flask_smorest import abort
+import attendance_summary
+from attendance_store import get_attendance_store
+from db import mongo
+from response_cache import RESPONSE_CACHE
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
+
+# "flush": POST /attendance responds once the record is written.
+# "enqueue": it responds 202 as soon as the record is queued; records still
+# queued are lost if the process is killed before close() runs.
+DURABILITY_FLUSH = "flush"
+DURABILITY_ENQUEUE = "enqueue"
+DURABILITY_MODES = (DURABILITY_FLUSH, DURABILITY_ENQUEUE)
+
+
+class AttendanceWriteBuffer:
+    """
+    Write-behind buffer that coalesces single attendance records into batches.
+
+    Records are queued in process and a background thread upserts them on
+    (student_id, date) with the attendance store's unordered bulk_write every
+    `interval_ms` milliseconds or as soon as `max_records` are waiting,
+    whichever comes first. When a batch marks the same student twice on one
+    day the last record wins. At most `max_queue` records may wait; beyond
+    that callers get a 503 with Retry-After.
+
+    close() flushes whatever is still queued and is registered with atexit
+    when the flusher starts.
+    """
+
+    def __init__(self, enabled=False, max_records=500, interval_ms=50, max_queue=10000,
+                 durability=DURABILITY_FLUSH, retry_after=1):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = None
+        self._atexit = False
+        self.app = None
+        # Called with (seconds, written, failed) after every flush.
+        self.flush_listeners = []
+        self.configure(enabled, max_records, interval_ms, max_queue, durability, retry_after)
+
+    def configure(self, enabled=None, max_records=None, interval_ms=None, max_queue=None, durability=None,
+                  retry_after=None, app=None):
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if max_records is not None:
+                self.max_records = max_records
+            if interval_ms is not None:
+                self.interval_ms = interval_ms
+            if max_queue is not None:
+                self.max_queue = max_queue
+                self._queue = queue.Queue(max_queue)
+            if durability is not None:
+                if durability not in DURABILITY_MODES:
+                    raise ValueError(f"Unknown durability mode {durability!r}, use one of {DURABILITY_MODES}.")
+                self.durability = durability
+            if retry_after is not None:
+                self.retry_after = retry_after
+            if app is not None:
+                self.app = app
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _start(self):
+        # Started on first use so that pre-forking servers run one flusher per
+        # worker; a thread inherited across a fork is no longer alive.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._stopping,), name="attendance-write-behind", daemon=True
+                )
+                self._thread.start()
+                if not self._atexit:
+                    atexit.register(self.close)
+                    self._atexit = True
+
+    def submit(self, record):
+        """
+        Queue a validated record with a normalized `date`.
+
+        In "flush" mode this blocks until the record's batch is written and
+        raises if its write failed; in "enqueue" mode it returns at once.
+        """
+        self._start()
+        future = Future()
+        try:
+            self._queue.put_nowait((record, future))
+        except queue.Full:
+            logger.warning("Attendance write-behind queue is full, rejecting record.")
+            abort(
+                503,
+                message="The server is busy, please retry shortly.",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        if self.durability == DURABILITY_FLUSH:
+            future.result()
+
+    def _run(self, stopping):
+        # Polls so that close() is noticed, then drains the queue before exiting.
+        while not (stopping.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.interval_ms / 1000
+            while len(batch) < self.max_records:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _write(self, batch):
+        """
+        Upsert a batch with one bulk_write per date and return the errors by (student_id, date).
+        """
+        latest = {}
+        for record, _ in batch:
+            latest[(record["student_id"], record["date"])] = record
+        by_date = defaultdict(list)
+        for (student_id, date), record in latest.items():
+            by_date[date].append({"student_id": student_id, "present": bool(record.get("present"))})
+
+        errors = {}
+        with self.app.app_context():
+            store = get_attendance_store()
+            for date, rows in by_date.items():
+                try:
+                    results, changes = store.upsert_many(date, rows)
+                    attendance_summary.apply_changes(mongo.db, changes)
+                except Exception as e:
+                    results = [{"student_id": row["student_id"], "status": "error", "error": str(e)} for row in rows]
+                for result in results:
+                    if result["status"] == "error":
+                        errors[(result["student_id"], date)] = result["error"]
+        RESPONSE_CACHE.bump("attendance")
+        return errors
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            errors = self._write(batch)
+        except Exception as e:
+            errors = {(record["student_id"], record["date"]): str(e) for record, _ in batch}
+        failed = 0
+        for record, future in batch:
+            error = errors.get((record["student_id"], record["date"]))
+            if error is None:
+                future.set_result(None)
+            else:
+                failed += 1
+                future.set_exception(RuntimeError(error))
+        elapsed = time.perf_counter() - started
+        if failed:
+            logger.error("%s of %s buffered attendance records failed to flush: %s",
+                         failed, len(batch), next(iter(errors.values())))
+        for listener in self.flush_listeners:
+            listener(elapsed, len(batch) - failed, failed)
+
+    def close(self):
+        """
+        Flush every queued record and stop the flusher.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._stopping.set()
+            thread.join()
+
+
+ATTENDANCE_BUFFER = AttendanceWriteBuffer()
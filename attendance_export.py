@@ -0,0 +1,133 @@
+import csv
+import datetime
+import io
+import itertools
+
+# Columns an export may contain; the student ones are read from `students`.
+FIELDS = ("student_id", "email", "name", "dept", "batch", "sem", "date", "present")
+STUDENT_FIELDS = ("email", "name", "dept", "batch", "sem")
+DEFAULT_FIELDS = ("student_id", "dept", "batch", "sem", "date", "present")
+FORMATS = ("csv", "parquet")
+
+
+def export_rows(db, store, cohort=None, start=None, end=None, fields=DEFAULT_FIELDS, chunk_size=1000):
+    """
+    Yield one tuple of `fields` per attendance record of the matching students.
+
+    Students matching `cohort` are read `chunk_size` at a time with only the
+    requested student fields; each chunk's attendance within [start, end] is
+    then fetched with one $in query and joined in memory, so memory use does
+    not grow with the size of the export.
+
+    The students cursor is built before returning, so the generator needs no
+    request context when it backs a streamed response; PyMongo only sends the
+    query once the first row is pulled.
+    """
+    projection = {field: 1 for field in fields if field in STUDENT_FIELDS} or {"_id": 1}
+    students = db.students.find(cohort or {}, projection).sort("_id", 1).batch_size(chunk_size)
+
+    def rows():
+        try:
+            for chunk in iter(lambda: list(itertools.islice(students, chunk_size)), []):
+                by_id = {str(student["_id"]): student for student in chunk}
+                for record in store.for_students(list(by_id), start, end):
+                    student = by_id[record["student_id"]]
+                    yield tuple(student.get(field) if field in STUDENT_FIELDS else record.get(field) for field in fields)
+        finally:
+            students.close()
+
+    return rows()
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def csv_chunks(rows, fields, rows_per_chunk=1000):
+    """
+    Encode rows as CSV with a header line, yielding `rows_per_chunk` rows of text at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(value) for value in row])
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def require_pyarrow():
+    """
+    Import pyarrow, which Parquet exports need but the API does not depend on.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow, install it with `pip install pyarrow`.")
+    return pyarrow
+
+
+class _Drain(io.RawIOBase):
+    """
+    Write-only sink that hands back what was written since the last drain().
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def parquet_chunks(rows, fields, row_group_size=50000):
+    """
+    Encode rows as a Parquet file written one row group at a time, yielding
+    the bytes of each row group as soon as it is written.
+    """
+    pa = require_pyarrow()
+    types = {
+        "student_id": pa.string(), "email": pa.string(), "name": pa.string(), "dept": pa.string(),
+        "batch": pa.int64(), "sem": pa.int64(), "date": pa.timestamp("ms"), "present": pa.bool_(),
+    }
+    schema = pa.schema([(field, types[field]) for field in fields])
+    sink = _Drain()
+    writer = pa.parquet.ParquetWriter(sink, schema)
+    rows = iter(rows)
+    for group in iter(lambda: list(itertools.islice(rows, row_group_size)), []):
+        columns = zip(*group)
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=schema.field(index).type) for index, column in enumerate(columns)], schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def encode(rows, fields, fmt="csv", row_group_size=50000):
+    """
+    The chunks of an export in `fmt`, "csv" or "parquet".
+    """
+    if fmt == "parquet":
+        return parquet_chunks(rows, fields, row_group_size)
+    return csv_chunks(rows, fields)
@@ -0,0 +1,529 @@
+import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import current_app
+from flask_smorest import abort
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from db import mongo
+from helper import decode_cursor, encode_cursor, keyset_query, page_size, paginate
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Attendance can be stored in one of two layouts, selected with ATTENDANCE_STORAGE:
+#
+#   daily     one document per student per day in `attendance` (the original layout):
+#             {"student_id", "date", "present", "sem"}
+#   bucketed  one document per student per month in `attendance_buckets`:
+#             {"_id": "<student_id>/<YYYY-MM>", "student_id", "month", "sem",
+#              "marked", "present", "total", "present_count"}
+#             where bit (day - 1) of `marked` is set for every day with a record
+#             and the same bit of `present` is set when the student was present.
+#
+# `sem` is the student's semester when the row (or the month's first record)
+# was written, so the semester summaries survive cohort promotions. Rows
+# written before it was recorded have none.
+#
+# Both stores return records shaped like daily documents so the GET responses
+# do not depend on the layout.
+STORAGE_DAILY = "daily"
+STORAGE_BUCKETED = "bucketed"
+# Keyset of date-range pages in the daily layout, served by the date_student_id_id index.
+RANGE_KEYS = ("date", "student_id", "_id")
+
+
+def normalize_date(value):
+    """
+    Midnight UTC of `value`, a DD-MM-YYYY string, a date or a datetime.
+
+    Attendance dates are stored as naive datetimes, which PyMongo writes as
+    UTC, so every record of a day compares equal and range bounds line up.
+
+    Raises:
+        ValueError: If a string is not a DD-MM-YYYY date.
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value, "%d-%m-%Y")
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return datetime.datetime(value.year, value.month, value.day)
+
+
+def date_filter(start=None, end=None):
+    """
+    A {"$gte", "$lte"} filter for the given bounds, or None when there are none.
+    """
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = start
+    if end is not None:
+        bounds["$lte"] = end
+    return bounds or None
+
+
+def student_cohorts(db, student_ids):
+    """
+    Fetch dept/batch/sem for the given student ids in one query.
+    """
+    object_ids = []
+    for student_id in student_ids:
+        try:
+            object_ids.append(ObjectId(student_id))
+        except (InvalidId, TypeError):
+            pass
+    projection = {"dept": 1, "batch": 1, "sem": 1}
+    return {str(s["_id"]): s for s in db.students.find({"_id": {"$in": object_ids}}, projection)}
+
+
+def _cohort(student, stored_sem=None):
+    """
+    The cohort a record counts towards: the student's dept and batch, and the
+    sem stored with the record, or the student's current sem if it has none.
+    """
+    if student is None:
+        return None
+    sem = stored_sem if stored_sem is not None else student.get("sem")
+    return {"dept": student.get("dept"), "batch": student.get("batch"), "sem": sem}
+
+
+def _bulk_results(rows, operations, statuses, changes, collection):
+    """
+    Run `operations` unordered and turn the outcome into per-row results.
+
+    `statuses[i]` and `changes[i]` describe what row i does when its write
+    succeeds, a None status meaning "created" if the write upserted and
+    "updated" otherwise. Rows whose write fails are reported as errors and
+    their change is dropped.
+    """
+    errors = {}
+    upserted = {}
+    indexed = [index for index, operation in enumerate(operations) if operation is not None]
+    if indexed:
+        try:
+            result = collection.bulk_write([operations[index] for index in indexed], ordered=False)
+            upserted = result.upserted_ids
+        except BulkWriteError as e:
+            upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+            errors = {indexed[item["index"]]: item["errmsg"] for item in e.details.get("writeErrors", [])}
+        upserted = {indexed[index] for index in upserted}
+    results, applied = [], []
+    for index, row in enumerate(rows):
+        entry = {"student_id": row["student_id"]}
+        if index in errors:
+            entry.update(status="error", error=errors[index])
+        else:
+            entry["status"] = statuses[index] or ("created" if index in upserted else "updated")
+            applied.append(changes[index])
+        results.append(entry)
+    return results, applied
+
+
+class DailyAttendanceStore:
+    """
+    One document per student per day, in the `attendance` collection.
+    """
+
+    name = STORAGE_DAILY
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.attendance
+
+    def insert(self, record):
+        """
+        Insert a single record and return the summary change it causes.
+        """
+        student_id = record.get("student_id")
+        student = student_cohorts(self.db, [student_id]).get(student_id) if student_id else None
+        if student and student.get("sem") is not None:
+            record["sem"] = student["sem"]
+        self.collection.insert_one(record)
+        return [(student_id, record["date"], int(bool(record.get("present"))), 1, _cohort(student))]
+
+    def upsert_many(self, date, rows):
+        """
+        Upsert rows for `date` on (student_id, date) with one unordered bulk_write.
+
+        Args:
+            date (datetime.datetime): The attendance date.
+            rows (list): Validated {"student_id", "present"} rows.
+
+        Returns:
+            A tuple (results, changes): one {"student_id", "status"} entry per
+            row, and the (student_id, date, present_delta, total_delta, cohort)
+            changes to apply to the attendance summaries.
+        """
+        if not rows:
+            return [], []
+        student_ids = [row["student_id"] for row in rows]
+        students = student_cohorts(self.db, student_ids)
+        previous = {
+            record["student_id"]: record
+            for record in self.collection.find(
+                {"date": date, "student_id": {"$in": student_ids}}, {"student_id": 1, "present": 1, "sem": 1}
+            )
+        }
+        operations, statuses, changes = [], [], []
+        for row in rows:
+            student = students.get(row["student_id"])
+            update = {"$set": {"present": row["present"]}}
+            if student and student.get("sem") is not None:
+                update["$setOnInsert"] = {"sem": student["sem"]}
+            operations.append(UpdateOne({"student_id": row["student_id"], "date": date}, update, upsert=True))
+            existing = previous.get(row["student_id"])
+            if existing is not None:
+                statuses.append("updated")
+                delta = int(row["present"]) - int(bool(existing.get("present")))
+                changes.append((row["student_id"], date, delta, 0, _cohort(student, existing.get("sem"))))
+            else:
+                statuses.append(None)
+                changes.append((row["student_id"], date, int(row["present"]), 1, _cohort(student)))
+        return _bulk_results(rows, operations, statuses, changes, self.collection)
+
+    def page(self, args):
+        return paginate(self.collection, args, keys=("date", "_id"))
+
+    def stream(self, args):
+        query = keyset_query(args, keys=("date", "_id"))
+        cursor = self.collection.find(query).sort([("date", 1), ("_id", 1)])
+        return cursor.batch_size(current_app.config["STREAM_BATCH_SIZE"])
+
+    def for_student(self, student_id):
+        return self.collection.find({"student_id": student_id})
+
+    def for_date(self, date):
+        return self.collection.find({"date": date})
+
+    @staticmethod
+    def _range_query(start, end, student_ids=None):
+        query = {"date": date_filter(start, end)}
+        if student_ids is not None:
+            query["student_id"] = {"$in": student_ids}
+        return query
+
+    def page_range(self, args, start, end, student_ids=None):
+        """
+        Fetch one page of the records dated within [start, end], optionally
+        limited to `student_ids`, ordered by (date, student_id, _id).
+        """
+        return paginate(self.collection, args, self._range_query(start, end, student_ids), keys=RANGE_KEYS)
+
+    def stream_range(self, args, start, end, student_ids=None):
+        query = keyset_query(args, self._range_query(start, end, student_ids), RANGE_KEYS)
+        cursor = self.collection.find(query).sort([(key, 1) for key in RANGE_KEYS])
+        return cursor.batch_size(current_app.config["STREAM_BATCH_SIZE"])
+
+    @staticmethod
+    def monthly_group(field):
+        """
+        $group keyed by month counting the daily records unwound into `field`;
+        documents without a record fall into a null month with zero counts.
+        """
+        return {
+            "_id": {"$dateToString": {"format": "%Y-%m", "date": f"${field}.date"}},
+            "present": {"$sum": {"$cond": [f"${field}.present", 1, 0]}},
+            "total": {"$sum": {"$cond": [{"$ifNull": [f"${field}.date", False]}, 1, 0]}},
+        }
+
+    def for_students(self, student_ids, start=None, end=None):
+        """
+        Return the (student_id, date, present) records of `student_ids` dated
+        within [start, end], ordered by student and date.
+        """
+        query = {"student_id": {"$in": student_ids}}
+        dates = date_filter(start, end)
+        if dates:
+            query["date"] = dates
+        projection = {"_id": 0, "student_id": 1, "date": 1, "present": 1}
+        return self.collection.find(query, projection).sort([("student_id", 1), ("date", 1)])
+
+
+class BucketedAttendanceStore:
+    """
+    One document per student per month, in the `attendance_buckets` collection.
+    """
+
+    name = STORAGE_BUCKETED
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.attendance_buckets
+
+    @staticmethod
+    def bucket_id(student_id, date):
+        return f"{student_id}/{date:%Y-%m}"
+
+    @staticmethod
+    def expand(bucket, day=None):
+        """
+        Yield the daily-shaped records held in a bucket, in day order.
+        """
+        year, month = (int(part) for part in bucket["month"].split("-"))
+        marked, present = bucket.get("marked", 0), bucket.get("present", 0)
+        for current in ([day] if day else range(1, 32)):
+            mask = 1 << (current - 1)
+            if marked & mask:
+                record = {
+                    "_id": f"{bucket['_id']}/{current:02d}",
+                    "student_id": bucket["student_id"],
+                    "date": datetime.datetime(year, month, current),
+                    "present": bool(present & mask),
+                }
+                if bucket.get("sem") is not None:
+                    record["sem"] = bucket["sem"]
+                yield record
+
+    def _mark(self, student_id, date, present, bucket, student):
+        """
+        Build the guarded update that marks one day of a bucket.
+
+        A new bucket records the student's current sem, which every day of
+        the month then counts towards.
+
+        Returns:
+            A tuple (operation, status, change); operation is None when the
+            stored value already matches.
+        """
+        mask = 1 << (date.day - 1)
+        bucket_id = self.bucket_id(student_id, date)
+        cohort = _cohort(student, bucket.get("sem") if bucket else None)
+        if bucket is None or not bucket.get("marked", 0) & mask:
+            on_insert = {"student_id": student_id, "month": f"{date:%Y-%m}"}
+            if student and student.get("sem") is not None:
+                on_insert["sem"] = student["sem"]
+            operation = UpdateOne(
+                {"_id": bucket_id, "marked": {"$bitsAllClear": mask}},
+                {
+                    "$bit": {"marked": {"or": mask}, "present": {"or": mask if present else 0}},
+                    "$inc": {"total": 1, "present_count": int(present)},
+                    "$setOnInsert": on_insert,
+                },
+                upsert=True,
+            )
+            return operation, "created", (student_id, date, int(present), 1, cohort)
+        if bool(bucket.get("present", 0) & mask) == present:
+            return None, "updated", (student_id, date, 0, 0, cohort)
+        if present:
+            operation = UpdateOne(
+                {"_id": bucket_id, "present": {"$bitsAllClear": mask}},
+                {"$bit": {"present": {"or": mask}}, "$inc": {"present_count": 1}},
+            )
+            return operation, "updated", (student_id, date, 1, 0, cohort)
+        operation = UpdateOne(
+            {"_id": bucket_id, "present": {"$bitsAllSet": mask}},
+            {"$bit": {"present": {"and": ~mask}}, "$inc": {"present_count": -1}},
+        )
+        return operation, "updated", (student_id, date, -1, 0, cohort)
+
+    def insert(self, record):
+        if not record.get("student_id"):
+            raise ValueError("student_id is required with bucketed attendance storage")
+        present = bool(record.get("present"))
+        student_id = record["student_id"]
+        bucket = self.collection.find_one(
+            {"_id": self.bucket_id(student_id, record["date"])}, {"marked": 1, "present": 1, "sem": 1}
+        )
+        student = student_cohorts(self.db, [student_id]).get(student_id)
+        operation, _, change = self._mark(student_id, record["date"], present, bucket, student)
+        if operation is not None:
+            self.collection.bulk_write([operation])
+        return [change]
+
+    def upsert_many(self, date, rows):
+        if not rows:
+            return [], []
+        bucket_ids = [self.bucket_id(row["student_id"], date) for row in rows]
+        buckets = {
+            bucket["_id"]: bucket
+            for bucket in self.collection.find({"_id": {"$in": bucket_ids}}, {"marked": 1, "present": 1, "sem": 1})
+        }
+        students = student_cohorts(self.db, [row["student_id"] for row in rows])
+        operations, statuses, changes = [], [], []
+        for row, bucket_id in zip(rows, bucket_ids):
+            operation, status, change = self._mark(
+                row["student_id"], date, row["present"], buckets.get(bucket_id), students.get(row["student_id"])
+            )
+            operations.append(operation)
+            statuses.append(status)
+            changes.append(change)
+        return _bulk_results(rows, operations, statuses, changes, self.collection)
+
+    def _records_after(self, args, start_date=None, end_date=None, student_ids=None):
+        """
+        Return an iterator of (position, record) pairs in (month, bucket _id, day)
+        order, starting after the position encoded in `args["after"]`.
+
+        Records can be limited to [start_date, end_date] and to `student_ids`;
+        whole months are selected with the month_id index and the days outside
+        the range are skipped while expanding.
+
+        The cursor is built and configured before returning, so the iterator
+        needs no request context when it backs a streamed response; PyMongo
+        only sends the query on the first iteration.
+        """
+        query, start = {}, None
+        months = date_filter(start_date and f"{start_date:%Y-%m}", end_date and f"{end_date:%Y-%m}")
+        if months:
+            query["month"] = months
+        if student_ids is not None:
+            query["student_id"] = {"$in": student_ids}
+        if args.get("after"):
+            start = decode_cursor(args["after"])
+            if len(start) != 3:
+                abort(400, message="Invalid pagination cursor.")
+            month, bucket_id, _ = start
+            after = {"$or": [{"month": {"$gt": month}}, {"month": month, "_id": {"$gte": bucket_id}}]}
+            query = {"$and": [query, after]} if query else after
+        cursor = self.collection.find(query).sort([("month", 1), ("_id", 1)])
+        cursor = cursor.batch_size(current_app.config["STREAM_BATCH_SIZE"])
+
+        def records():
+            try:
+                for bucket in cursor:
+                    for record in self.expand(bucket):
+                        position = [bucket["month"], bucket["_id"], record["date"].day]
+                        if start and position[1] == start[1] and position[2] <= start[2]:
+                            continue
+                        if start_date is not None and record["date"] < start_date:
+                            continue
+                        if end_date is not None and record["date"] > end_date:
+                            continue
+                        yield position, record
+            finally:
+                cursor.close()
+
+        return records()
+
+    def page(self, args):
+        return self.page_range(args, None, None)
+
+    def stream(self, args):
+        return self.stream_range(args, None, None)
+
+    def page_range(self, args, start, end, student_ids=None):
+        """
+        Fetch one page of the records dated within [start, end], optionally
+        limited to `student_ids`, ordered by (month, bucket _id, day).
+        """
+        limit = page_size(args)
+        records, next_cursor, last = [], None, None
+        iterator = self._records_after(args, start, end, student_ids)
+        for position, record in iterator:
+            if len(records) == limit:
+                next_cursor = encode_cursor(last)
+                break
+            records.append(record)
+            last = position
+        iterator.close()
+        return records, next_cursor
+
+    def stream_range(self, args, start, end, student_ids=None):
+        return (record for _, record in self._records_after(args, start, end, student_ids))
+
+    def for_student(self, student_id):
+        for bucket in self.collection.find({"student_id": student_id}).sort("month", 1):
+            yield from self.expand(bucket)
+
+    def for_date(self, date):
+        query = {"month": f"{date:%Y-%m}", "marked": {"$bitsAllSet": 1 << (date.day - 1)}}
+        for bucket in self.collection.find(query):
+            yield from self.expand(bucket, day=date.day)
+
+    @staticmethod
+    def monthly_group(field):
+        # Buckets already hold per-month counters, so this only sums them.
+        return {
+            "_id": f"${field}.month",
+            "present": {"$sum": f"${field}.present_count"},
+            "total": {"$sum": f"${field}.total"},
+        }
+
+    def for_students(self, student_ids, start=None, end=None):
+        query = {"student_id": {"$in": student_ids}}
+        months = date_filter(start and f"{start:%Y-%m}", end and f"{end:%Y-%m}")
+        if months:
+            query["month"] = months
+        projection = {"student_id": 1, "month": 1, "marked": 1, "present": 1}
+        for bucket in self.collection.find(query, projection).sort([("student_id", 1), ("month", 1)]):
+            for record in self.expand(bucket):
+                if (start is None or record["date"] >= start) and (end is None or record["date"] <= end):
+                    del record["_id"]
+                    yield record
+
+
+STORES = {store.name: store for store in (DailyAttendanceStore, BucketedAttendanceStore)}
+
+
+def get_attendance_store():
+    """
+    The attendance store selected by the ATTENDANCE_STORAGE config.
+    """
+    return STORES[current_app.config["ATTENDANCE_STORAGE"]](mongo.db)
+
+
+def migrate(db, target, chunk_size=1000):
+    """
+    Copy every attendance record into the `target` layout.
+
+    The source collection is left untouched so the copy can be verified before
+    switching ATTENDANCE_STORAGE and dropping it. Re-running is safe: buckets
+    are replaced and daily rows are upserted on (student_id, date).
+
+    Returns:
+        The number of documents written to the target layout.
+    """
+    collection = db.attendance_buckets if target == STORAGE_BUCKETED else db.attendance
+    written, operations = 0, []
+
+    def flush():
+        nonlocal written, operations
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+
+    if target == STORAGE_BUCKETED:
+        # Rows come sorted by (student_id, date), so each bucket is complete
+        # once the next one starts and only one is held in memory at a time.
+        rows = db.attendance.find(
+            {"student_id": {"$type": "string"}, "date": {"$type": "date"}},
+            {"student_id": 1, "date": 1, "present": 1, "sem": 1},
+        ).sort([("student_id", 1), ("date", 1)])
+        def finish(bucket):
+            bucket["total"] = bin(bucket["marked"]).count("1")
+            bucket["present_count"] = bin(bucket["present"]).count("1")
+            operations.append(ReplaceOne({"_id": bucket["_id"]}, bucket, upsert=True))
+
+        bucket = None
+        for row in rows:
+            bucket_id = BucketedAttendanceStore.bucket_id(row["student_id"], row["date"])
+            if bucket is None or bucket["_id"] != bucket_id:
+                if bucket is not None:
+                    finish(bucket)
+                bucket = {"_id": bucket_id, "student_id": row["student_id"], "month": f"{row['date']:%Y-%m}",
+                          "marked": 0, "present": 0}
+            if bucket.get("sem") is None and row.get("sem") is not None:
+                # The month's first record with a sem, as a live bucket would hold.
+                bucket["sem"] = row["sem"]
+            mask = 1 << (row["date"].day - 1)
+            bucket["marked"] |= mask
+            bucket["present"] = bucket["present"] | mask if row.get("present") else bucket["present"] & ~mask
+            if len(operations) >= chunk_size:
+                flush()
+        if bucket is not None:
+            finish(bucket)
+    else:
+        for bucket in db.attendance_buckets.find().sort([("student_id", 1), ("month", 1)]):
+            for record in BucketedAttendanceStore.expand(bucket):
+                fields = {key: record[key] for key in ("present", "sem") if key in record}
+                operations.append(UpdateOne(
+                    {"student_id": record["student_id"], "date": record["date"]},
+                    {"$set": fields},
+                    upsert=True,
+                ))
+            if len(operations) >= chunk_size:
+                flush()
+    flush()
+    logger.info("Migrated attendance to the %s layout: %s documents written.", target, written)
+    return written
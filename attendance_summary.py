@@ -0,0 +1,188 @@
+from collections import defaultdict
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from indexes import INDEXES
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
+
+# attendance_summary holds present/total counters per student and per
+# (dept, batch, sem) cohort, for each month ("2024-01") and for the semester
+# the student was in when the attendance was marked ("sem-5"). The _id is
+# built from the scope, key and period so every counter is a single-key read.
+SUMMARY_COLLECTION = "attendance_summary"
+
+
+def student_summary_id(student_id, period):
+    return f"student/{student_id}/{period}"
+
+
+def cohort_summary_id(dept, batch, sem, period):
+    return f"cohort/{dept}/{batch}/{sem}/{period}"
+
+
+def _periods(date, cohort):
+    periods = [date.strftime("%Y-%m")]
+    if cohort and cohort.get("sem") is not None:
+        periods.append(f"sem-{cohort['sem']}")
+    return periods
+
+
+def apply_changes(db, changes):
+    """
+    Increment the summary counters for a set of raw attendance writes.
+
+    Args:
+        db: The PyMongo database.
+        changes (list): (student_id, date, present_delta, total_delta, cohort)
+            tuples, e.g. (id, date, 1, 1, cohort) for a new present row or
+            (id, date, -1, 0, cohort) when an existing row flips from present
+            to absent. `cohort` is the {dept, batch, sem} the record counts
+            towards, with the sem stored on it, or None for an unknown student.
+
+    Summaries can always be recomputed with rebuild(), so a failure here is
+    logged rather than failing the attendance write that triggered it.
+    """
+    changes = [change for change in changes if change[0] and (change[2] or change[3])]
+    if not changes:
+        return
+    try:
+        deltas = defaultdict(lambda: [0, 0])
+        fields = {}
+        for student_id, date, present, total, cohort in changes:
+            for period in _periods(date, cohort):
+                key = student_summary_id(student_id, period)
+                fields[key] = {"scope": "student", "student_id": student_id, "period": period}
+                deltas[key][0] += present
+                deltas[key][1] += total
+                if cohort:
+                    key = cohort_summary_id(cohort["dept"], cohort["batch"], cohort["sem"], period)
+                    fields[key] = {"scope": "cohort", **cohort, "period": period}
+                    deltas[key][0] += present
+                    deltas[key][1] += total
+        operations = [
+            UpdateOne(
+                {"_id": key},
+                {"$inc": {"present": present, "total": total}, "$setOnInsert": fields[key]},
+                upsert=True,
+            )
+            for key, (present, total) in deltas.items()
+        ]
+        db[SUMMARY_COLLECTION].bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        logger.error("Could not update attendance summaries, run a rebuild: %s", e)
+
+
+def _pipelines(storage):
+    """
+    Aggregations computing each kind of summary from the raw attendance rows,
+    or from the monthly counters of the buckets in the bucketed layout.
+    """
+    if storage == "bucketed":
+        base = [
+            {"$match": {"student_id": {"$type": "string"}}},
+            {"$addFields": {"present_count": {"$ifNull": ["$present_count", 0]}, "row_count": "$total"}},
+        ]
+    else:
+        base = [
+            {"$match": {"date": {"$type": "date"}, "student_id": {"$type": "string"}}},
+            {"$addFields": {
+                "month": {"$dateToString": {"format": "%Y-%m", "date": "$date"}},
+                "present_count": {"$cond": ["$present", 1, 0]},
+                "row_count": 1,
+            }},
+        ]
+    with_student = base + [
+        {"$lookup": {
+            "from": "students",
+            "let": {"sid": {"$convert": {"input": "$student_id", "to": "objectId", "onError": None, "onNull": None}}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$sid"]}}},
+                {"$project": {"dept": 1, "batch": 1, "sem": 1}},
+            ],
+            "as": "student",
+        }},
+        {"$unwind": "$student"},
+        # The sem stored when the row was written; older rows fall back to the current one.
+        {"$addFields": {"sem": {"$ifNull": ["$sem", "$student.sem"]}}},
+        {"$addFields": {"semester": {"$concat": ["sem-", {"$toString": "$sem"}]}}},
+    ]
+    counters = {"present": {"$sum": "$present_count"}, "total": {"$sum": "$row_count"}}
+
+    def student(stages, period):
+        return stages + [
+            {"$group": {"_id": {"student_id": "$student_id", "period": period}, **counters}},
+            {"$project": {
+                "_id": {"$concat": ["student/", "$_id.student_id", "/", "$_id.period"]},
+                "scope": "student",
+                "student_id": "$_id.student_id",
+                "period": "$_id.period",
+                "present": 1,
+                "total": 1,
+            }},
+        ]
+
+    def cohort(period):
+        return with_student + [
+            {"$group": {
+                "_id": {"dept": "$student.dept", "batch": "$student.batch", "sem": "$sem", "period": period},
+                **counters,
+            }},
+            {"$project": {
+                "_id": {"$concat": [
+                    "cohort/", {"$toString": "$_id.dept"}, "/", {"$toString": "$_id.batch"},
+                    "/", {"$toString": "$_id.sem"}, "/", "$_id.period",
+                ]},
+                "scope": "cohort",
+                "dept": "$_id.dept",
+                "batch": "$_id.batch",
+                "sem": "$_id.sem",
+                "period": "$_id.period",
+                "present": 1,
+                "total": 1,
+            }},
+        ]
+
+    return [
+        student(base, "$month"),
+        student(with_student, "$semester"),
+        cohort("$month"),
+        cohort("$semester"),
+    ]
+
+
+def rebuild(db, storage="daily"):
+    """
+    Recompute attendance_summary from the attendance records held in the
+    `storage` layout ("daily" or "bucketed").
+
+    The result is built in a scratch collection and swapped in with a rename,
+    so readers never see a half-built summary. Semester counters use the sem
+    stored on each row or bucket when it was written, as apply_changes() does;
+    rows written before the sem was recorded fall back to the current one.
+
+    Run it with attendance writes stopped: increments applied to the live
+    collection while the scratch one is being filled are discarded by the
+    rename, and rows written mid-aggregation may or may not be counted.
+
+    Returns:
+        The number of summary documents written.
+    """
+    scratch = f"{SUMMARY_COLLECTION}_rebuild"
+    db[scratch].drop()
+    db[scratch].create_indexes(INDEXES[SUMMARY_COLLECTION])
+    source = db.attendance_buckets if storage == "bucketed" else db.attendance
+    for pipeline in _pipelines(storage):
+        source.aggregate(pipeline + [{"$merge": {"into": scratch, "whenMatched": "replace"}}])
+    count = db[scratch].count_documents({})
+    if count:
+        db[scratch].rename(SUMMARY_COLLECTION, dropTarget=True)
+    else:
+        db[SUMMARY_COLLECTION].delete_many({})
+    logger.info("Rebuilt %s with %s documents.", SUMMARY_COLLECTION, count)
+    return count
+
+
+def with_percentage(summary):
+    summary["percentage"] = round(100 * summary["present"] / summary["total"], 2) if summary["total"] else None
+    return summary
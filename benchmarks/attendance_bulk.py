@@ -0,0 +1,54 @@
+"""
+Compare marking a class with N single POST /attendance calls against one
+POST /attendance/bulk roll call.
+
+Usage:
+    python -m benchmarks.attendance_bulk [--students 120] [--mongomock]
+"""
+import argparse
+import json
+from benchmarks.harness import admin_headers, create_app, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=120)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app(use_mongomock=args.mongomock)
+    client = app.test_client()
+    headers = admin_headers(app)
+    student_ids = [f"bench-student-{i}" for i in range(args.students)]
+
+    def single_posts():
+        for student_id in student_ids:
+            client.post(
+                "/attendance",
+                json={"student_id": student_id, "date": "01-01-2024", "present": True},
+                headers=headers,
+            )
+
+    def bulk_post():
+        return client.post(
+            "/attendance/bulk",
+            json={
+                "date": "02-01-2024",
+                "records": [{"student_id": student_id, "present": True} for student_id in student_ids],
+            },
+            headers=headers,
+        )
+
+    single_time, _ = timed(single_posts)
+    bulk_time, response = timed(bulk_post)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    print(json.dumps({
+        "students": args.students,
+        "single_posts_ms": round(single_time * 1000, 2),
+        "bulk_post_ms": round(bulk_time * 1000, 2),
+        "speedup": round(single_time / bulk_time, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
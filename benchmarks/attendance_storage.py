@@ -0,0 +1,82 @@
+"""
+Compare the daily and bucketed attendance layouts: document count, storage
+size and the latency of the reads behind GET /attendance/<student_id> and
+the first page of GET /attendance/date/<date>.
+
+Needs a real mongod (mongomock has no $bit query operators). MONGO_URL must
+point at a scratch database, since the attendance collections are rewritten.
+
+Usage:
+    python -m benchmarks.attendance_storage [--students 500] [--days 60] [--queries 200] [--seed 42]
+"""
+import argparse
+import datetime
+import json
+import random
+from bson import BSON
+from benchmarks.harness import create_app, summarize, timed
+
+
+def storage_stats(db, name):
+    try:
+        stats = db.command("collStats", name)
+        return {"count": stats["count"], "size_bytes": stats["size"],
+                "storage_bytes": stats["storageSize"], "index_bytes": stats["totalIndexSize"]}
+    except Exception:
+        documents = list(db[name].find())
+        return {"count": len(documents), "size_bytes": sum(len(BSON.encode(d)) for d in documents)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    app = create_app()
+    import attendance_store
+    from db import mongo
+    from indexes import ensure_indexes
+
+    db = mongo.db
+    db.attendance.drop()
+    db.attendance_buckets.drop()
+    ensure_indexes(db)
+
+    student_ids = [f"{i:024x}" for i in range(args.students)]
+    start = datetime.datetime(2024, 1, 1)
+    dates = [start + datetime.timedelta(days=day) for day in range(args.days)]
+    for date in dates:
+        db.attendance.insert_many(
+            [{"student_id": student_id, "date": date, "present": rng.random() < 0.85} for student_id in student_ids]
+        )
+    attendance_store.migrate(db, attendance_store.STORAGE_BUCKETED)
+
+    report = {"students": args.students, "days": args.days, "seed": args.seed}
+    for storage, collection in (("daily", "attendance"), ("bucketed", "attendance_buckets")):
+        app.config["ATTENDANCE_STORAGE"] = storage
+        # The same picks for both layouts, so their latencies are comparable.
+        picks = random.Random(args.seed)
+        with app.app_context():
+            store = attendance_store.get_attendance_store()
+            # The first page GET /attendance/date/<date> serves, at the route's default page size.
+            page = {"limit": app.config["PAGE_SIZE_DEFAULT"]}
+            by_student = [timed(lambda: list(store.for_student(picks.choice(student_ids))))[0]
+                          for _ in range(args.queries)]
+            by_date = []
+            for _ in range(args.queries):
+                day = picks.choice(dates)
+                by_date.append(timed(lambda: store.page_range(page, day, day))[0])
+        report[storage] = {
+            "storage": storage_stats(db, collection),
+            "for_student": summarize(by_student),
+            "date_page": summarize(by_date),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
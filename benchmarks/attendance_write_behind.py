@@ -0,0 +1,86 @@
+"""
+Compare concurrent single POST /attendance calls written directly against the
+same calls going through the write-behind buffer, in both durability modes.
+
+Each client thread posts one record per student of its share of the class, as
+legacy clients do. The number of MongoDB writes to the attendance collection
+is reported next to the wall time.
+
+Usage:
+    python -m benchmarks.attendance_write_behind [--students 400] [--clients 16] [--mongomock]
+"""
+import argparse
+import json
+import threading
+from benchmarks.harness import admin_headers, create_app, summarize, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--interval-ms", type=float, default=20)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app(use_mongomock=args.mongomock)
+    from attendance_buffer import ATTENDANCE_BUFFER
+    from db import mongo
+
+    app.config["RESPONSE_CACHE_TTL"] = 0
+    headers = admin_headers(app)
+    collection = mongo.db.attendance
+    writes = []
+    bulk_write, insert_one = collection.bulk_write, collection.insert_one
+
+    # Count the write commands each mode sends to the attendance collection.
+    def counting(method):
+        def wrapper(*a, **k):
+            writes.append(1)
+            return method(*a, **k)
+        return wrapper
+
+    collection.bulk_write, collection.insert_one = counting(bulk_write), counting(insert_one)
+
+    def run(mode, day):
+        ATTENDANCE_BUFFER.configure(
+            enabled=mode != "direct", durability=mode if mode != "direct" else None, interval_ms=args.interval_ms
+        )
+        writes.clear()
+        durations, statuses = [], []
+
+        def client(offset):
+            test_client = app.test_client()
+            for i in range(offset, args.students, args.clients):
+                seconds, response = timed(lambda: test_client.post(
+                    "/attendance",
+                    json={"student_id": f"bench-student-{i}", "date": day, "present": True},
+                    headers=headers,
+                ))
+                durations.append(seconds)
+                statuses.append(response.status_code)
+
+        def all_clients():
+            threads = [threading.Thread(target=client, args=(offset,)) for offset in range(args.clients)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            ATTENDANCE_BUFFER.close()
+
+        total, _ = timed(all_clients)
+        assert set(statuses) <= {200, 202}, statuses
+        return {**summarize(durations), "wall_ms": round(total * 1000, 2), "write_commands": len(writes)}
+
+    print(json.dumps({
+        "students": args.students,
+        "clients": args.clients,
+        "interval_ms": args.interval_ms,
+        "direct": run("direct", "01-01-2024"),
+        "write_behind_flush": run("flush", "02-01-2024"),
+        "write_behind_enqueue": run("enqueue", "03-01-2024"),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
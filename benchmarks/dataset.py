@@ -0,0 +1,158 @@
+"""
+Synthetic, reproducible datasets for the benchmarks.
+
+Documents follow PlainStudentSchema, PlainStaffSchema and AttendanceSchema as
+they are stored by the routes (hashed passwords, created_at, attendance dates
+as datetimes). The same seed always produces the same data. Every account
+uses the password in PASSWORD.
+
+Usage (against the scratch database in MONGO_URL):
+    python -m benchmarks.dataset --students 50000 --staff 500 --attendance 10000000
+"""
+import argparse
+import datetime
+import itertools
+import json
+import random
+import time
+
+PASSWORD = "benchmark"
+DEPARTMENTS = ("CSE", "IT", "ECE", "EE", "ME", "CE")
+FIRST_NAMES = ("Aarav", "Diya", "Ishaan", "Kavya", "Vihaan", "Meera", "Arjun", "Priya", "Rohan", "Sneha")
+LAST_NAMES = ("Shah", "Patel", "Mehta", "Iyer", "Rao", "Joshi", "Desai", "Nair", "Gupta", "Kapoor")
+FIRST_DAY = datetime.datetime(2023, 6, 1)
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def students(count, rng, password_hash):
+    for i in range(count):
+        yield {
+            "email": f"student{i}@college.student.in",
+            "name": _name(rng),
+            "phone": rng.randint(6000000000, 9999999999),
+            "dept": rng.choice(DEPARTMENTS),
+            "batch": rng.randint(2020, 2024),
+            "sem": rng.randint(1, 8),
+            "password": password_hash,
+            "created_at": FIRST_DAY,
+        }
+
+
+def staff(count, rng, password_hash):
+    for i in range(count):
+        yield {
+            "email": f"staff{i}@college.staff.in",
+            "name": _name(rng),
+            "phone": rng.randint(6000000000, 9999999999),
+            "dept": rng.choice(DEPARTMENTS),
+            "is_admin": 1 if i == 0 else 0,
+            "password": password_hash,
+            "created_at": FIRST_DAY,
+        }
+
+
+def school_days(start=FIRST_DAY):
+    """
+    Yield weekdays from `start` onwards.
+    """
+    day = start
+    while True:
+        if day.weekday() < 5:
+            yield day
+        day += datetime.timedelta(days=1)
+
+
+def attendance(student_ids, rows, rng, present_rate=0.85):
+    """
+    Yield about `rows` daily records: every student is marked on the same
+    run of school days, one day after the other.
+    """
+    if not student_ids:
+        return
+    days = max(1, rows // len(student_ids))
+    for date in itertools.islice(school_days(), days):
+        for student_id in student_ids:
+            yield {"student_id": student_id, "date": date, "present": rng.random() < present_rate}
+
+
+def _insert(collection, documents, chunk_size, keep_ids=True):
+    ids, count = [], 0
+    for chunk in iter(lambda: list(itertools.islice(documents, chunk_size)), []):
+        inserted = collection.insert_many(chunk, ordered=False).inserted_ids
+        count += len(inserted)
+        if keep_ids:
+            ids.extend(inserted)
+    return ids if keep_ids else count
+
+
+def populate(db, students_count=2000, staff_count=50, attendance_rows=60000, seed=42,
+             chunk_size=10000, storage="daily", rounds=None, summaries=True):
+    """
+    Drop and refill the students, staff and attendance collections of `db`,
+    then create the declared indexes and, with `summaries`, rebuild the
+    attendance summaries.
+
+    Returns:
+        A dict with the inserted counts, the student and staff ids and the
+        time taken in seconds.
+    """
+    from passlib.hash import pbkdf2_sha256
+    import attendance_store
+    import attendance_summary
+    from indexes import ensure_indexes
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    hasher = pbkdf2_sha256.using(rounds=rounds) if rounds else pbkdf2_sha256
+    password_hash = hasher.hash(PASSWORD)
+    for name in ("students", "staff", "attendance", "attendance_buckets", "attendance_summary"):
+        db.drop_collection(name)
+
+    student_ids = _insert(db.students, students(students_count, rng, password_hash), chunk_size)
+    staff_ids = _insert(db.staff, staff(staff_count, rng, password_hash), chunk_size)
+    # Attendance rows reference students by their string id, as the routes do.
+    rows = _insert(
+        db.attendance, attendance([str(i) for i in student_ids], attendance_rows, rng), chunk_size, keep_ids=False
+    )
+    if storage == attendance_store.STORAGE_BUCKETED:
+        attendance_store.migrate(db, storage, chunk_size)
+    # Building the indexes after the bulk load is much faster than maintaining them during it.
+    ensure_indexes(db)
+    if summaries:
+        attendance_summary.rebuild(db, storage)
+
+    return {
+        "students": len(student_ids),
+        "staff": len(staff_ids),
+        "attendance": rows,
+        "student_ids": student_ids,
+        "staff_ids": staff_ids,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--staff", type=int, default=500)
+    parser.add_argument("--attendance", type=int, default=10000000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    from benchmarks.harness import create_app
+    from db import mongo
+
+    app = create_app()
+    result = populate(
+        mongo.db, args.students, args.staff, args.attendance, args.seed, args.chunk_size,
+        app.config["ATTENDANCE_STORAGE"], app.config["PASSWORD_HASH_ROUNDS"],
+    )
+    print(json.dumps({key: value for key, value in result.items() if not key.endswith("_ids")}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Shared setup for the benchmarks that drive the Flask app through its test client.
+
+By default the app talks to the database in MONGO_URL, which should point at a
+scratch database because benchmarks write to it. With use_mongomock=True an
+in-memory mongomock client is swapped in instead (pip install mongomock).
+"""
+import os
+import statistics
+import time
+
+
+def create_app(use_mongomock=False):
+    if use_mongomock:
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017/benchmark")
+        os.environ["CREATE_INDEXES_ON_STARTUP"] = "0"
+    from app import app
+    from db import mongo
+
+    if use_mongomock:
+        import mongomock
+        from flask import abort
+        from mongomock.collection import Collection
+
+        def find_one_or_404(self, *args, **kwargs):
+            document = self.find_one(*args, **kwargs)
+            if document is None:
+                abort(404)
+            return document
+
+        Collection.find_one_or_404 = find_one_or_404
+        mongo.cx = mongomock.MongoClient()
+        mongo.db = mongo.cx["benchmark"]
+    return app
+
+
+def admin_headers(app):
+    """
+    Insert an admin staff member and return Authorization headers for it.
+    """
+    from flask_jwt_extended import create_access_token
+    from passlib.hash import pbkdf2_sha256
+    from db import mongo
+
+    admin_id = mongo.db.staff.insert_one(
+        {
+            "name": "Benchmark Admin",
+            "email": f"admin{time.time_ns()}@college.staff.in",
+            "phone": 9000000000,
+            "dept": "ADMIN",
+            "is_admin": 1,
+            "password": pbkdf2_sha256.hash("benchmark"),
+        }
+    ).inserted_id
+    with app.app_context():
+        token = create_access_token(identity=str(admin_id), fresh=True)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def summarize(durations):
+    """
+    Return count, p50/p95/p99 latency in milliseconds and throughput per second.
+    """
+    ordered = sorted(durations)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(50), 3),
+        "p95_ms": round(percentile(95), 3),
+        "p99_ms": round(percentile(99), 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "throughput_per_s": round(len(ordered) / sum(ordered), 1) if sum(ordered) else None,
+    }
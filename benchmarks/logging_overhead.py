@@ -0,0 +1,71 @@
+"""
+Per-call cost on the request thread of the previous logging setup (synchronous
+FileHandler, f-string messages) against the QueueHandler setup in
+log_services/logger.py (lazy %-style arguments, file I/O on a listener thread).
+
+Usage:
+    python -m benchmarks.logging_overhead [--calls 20000] [--per-request 4]
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import time
+
+
+def isolated_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def measure(fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--per-request", type=int, default=4, help="log calls made by a typical request")
+    args = parser.parse_args()
+
+    from log_services.logger import LazyQueueHandler, RequestIdFilter, build_file_handler
+
+    directory = tempfile.mkdtemp()
+    before_handler = logging.FileHandler(os.path.join(directory, "before.log"), mode="w")
+    before_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    before = isolated_logger("benchmark.before", before_handler)
+
+    os.environ["LOG_FILE"] = os.path.join(directory, "after.log")
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    listener = logging.handlers.QueueListener(log_queue, build_file_handler())
+    listener.start()
+    after = isolated_logger("benchmark.after", queue_handler)
+
+    student = {"_id": "65a1f0c2e4b0a1b2c3d4e5f6", "name": "Student", "sem": 5}
+    results = {
+        "before: info, f-string": measure(lambda i: before.info(f"Fetching attendance for {student} #{i}"), args.calls),
+        "after:  info, %-args": measure(lambda i: after.info("Fetching attendance for %s #%s", student, i), args.calls),
+        "before: disabled debug, f-string": measure(lambda i: before.debug(f"Student {student} #{i}"), args.calls),
+        "after:  disabled debug, %-args": measure(lambda i: after.debug("Student %s #%s", student, i), args.calls),
+    }
+    listener.stop()
+
+    for name, micros in results.items():
+        print(f"{name:<34} {micros:7.2f} us/call")
+    before_request = results["before: info, f-string"] * args.per_request
+    after_request = results["after:  info, %-args"] * args.per_request
+    print(f"per request ({args.per_request} calls): {before_request:.1f} us before, {after_request:.1f} us after")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Micro-benchmark of the per-document cost of serializer.to_json against the
+json.loads(json_util.dumps(doc)) round trip it replaced.
+
+Usage:
+    python -m benchmarks.serializer [--docs 1000] [--repeat 5]
+"""
+import argparse
+import datetime
+import json
+import timeit
+import bson
+from bson import ObjectId, json_util
+from serializer import to_json
+
+
+def sample_documents(count):
+    """
+    Build `count` student documents and pass them through BSON, so they carry
+    the types a real server returns (bson.Int64 phones, millisecond datetimes).
+    """
+    now = datetime.datetime(2024, 1, 15, 9, 30, 12, 345000)
+    documents = [
+        {
+            "_id": ObjectId(),
+            "email": f"student{i}@college.student.in",
+            "name": f"Student {i}",
+            "phone": 9000000000 + i,
+            "dept": "CSE",
+            "batch": 2023,
+            "sem": 5,
+            "password": "$pbkdf2-sha256$29000$abcdefghijklmnop$qrstuvwxyz0123456789",
+            "created_at": now,
+            "updated_at": now + datetime.timedelta(days=i % 30),
+        }
+        for i in range(count)
+    ]
+    return [bson.decode(bson.encode(document)) for document in documents]
+
+
+def round_trip(documents):
+    return json.loads(json_util.dumps(documents))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = sample_documents(args.docs)
+    assert to_json(documents) == round_trip(documents), "serializer output differs from json_util"
+
+    for name, fn in (("json_util round trip", round_trip), ("serializer.to_json", to_json)):
+        best = min(timeit.repeat(lambda: fn(documents), number=1, repeat=args.repeat))
+        print(f"{name:<22} {best / args.docs * 1e6:8.2f} us/doc")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Drive every route through the Flask test client against a synthetic dataset
+and record p50/p95/p99 latency, throughput and peak RSS per route.
+
+Results are written as JSON, keyed by the current git commit, so that runs on
+two commits can be compared:
+
+    python -m benchmarks.suite --mongomock --output before.json
+    git checkout other-branch
+    python -m benchmarks.suite --mongomock --output after.json --compare before.json
+
+Without --mongomock the suite uses the scratch database in MONGO_URL and
+replaces its students, staff and attendance collections.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter
+from benchmarks.dataset import FIRST_DAY, PASSWORD, populate
+from benchmarks.harness import create_app, summarize
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def build_scenarios(app, headers, data):
+    """
+    Return (name, prepare) pairs in the order they must run. prepare(i) is
+    called outside the timed section and returns the (method, url, kwargs)
+    of the i-th request.
+    """
+    from bson import ObjectId
+    from flask_jwt_extended import create_access_token
+    from db import mongo
+
+    student_ids = [str(i) for i in data["student_ids"]]
+    staff_ids = [str(i) for i in data["staff_ids"]]
+    cohort = mongo.db.students.find_one({}, {"_id": 0, "dept": 1, "batch": 1, "sem": 1})
+    registered = {"students": [], "staff": []}
+    run = time.time_ns()
+
+    def cycle(ids, i):
+        return ids[i % len(ids)]
+
+    def day(i):
+        return (datetime.date(2030, 1, 1) + datetime.timedelta(days=i)).strftime("%d-%m-%Y")
+
+    def week(i, offset=0):
+        # Days within the generated dataset, which starts on FIRST_DAY.
+        return (FIRST_DAY + datetime.timedelta(days=i % 28 + offset)).strftime("%d-%m-%Y")
+
+    def logout(i):
+        with app.app_context():
+            token = create_access_token(identity=staff_ids[0])
+        return "POST", "/logout", {"headers": {"Authorization": f"Bearer {token}"}}
+
+    def refresh(i):
+        from refresh_tokens import issue_tokens
+        with app.app_context():
+            _, token = issue_tokens(staff_ids[0])
+        return "POST", "/refresh", {"headers": {"Authorization": f"Bearer {token}"}}
+
+    def register(kind, email):
+        def prepare(i):
+            body = {"name": "Bench Member", "email": email.format(run=run, i=i), "phone": 9000000000 + i,
+                    "dept": "CSE", "password": PASSWORD}
+            if kind == "students":
+                body.update(batch=2024, sem=1)
+            return "POST", f"/register/{'student' if kind == 'students' else 'staff'}", \
+                {"json": body, "headers": headers, "_record": kind}
+        return prepare
+
+    def import_members(kind, email, rows=3):
+        def prepare(i):
+            # A small CSV upload; every row is a new member, so each one is hashed and inserted.
+            lines = ["name,email,phone,dept,password" + (",batch,sem" if kind == "students" else "")]
+            for j in range(rows):
+                line = f"Bench Import,{email.format(run=run, i=i, j=j)},{9000000000 + i * rows + j},CSE,{PASSWORD}"
+                lines.append(line + (",2024,1" if kind == "students" else ""))
+            path = f"/register/{'student' if kind == 'students' else 'staff'}/import"
+            return "POST", path, {"data": "\n".join(lines).encode(), "content_type": "text/csv", "headers": headers}
+        return prepare
+
+    def delete(kind, path):
+        def prepare(i):
+            # Delete the members registered above; a fresh id (404) once they run out.
+            member_id = registered[kind].pop() if registered[kind] else str(ObjectId())
+            return "DELETE", f"{path}/{member_id}", {"headers": headers}
+        return prepare
+
+    return [
+        ("POST /login (staff)", lambda i: (
+            "POST", "/login", {"json": {"email": f"staff{i % len(staff_ids)}@college.staff.in", "password": PASSWORD}})),
+        ("POST /login (student)", lambda i: (
+            "POST", "/login", {"json": {"email": f"student{i % len(student_ids)}@college.student.in",
+                                        "password": PASSWORD}})),
+        ("POST /refresh", refresh),
+        ("POST /logout", logout),
+        ("POST /register/student", register("students", "bench{run}-{i}@college.student.in")),
+        ("POST /register/staff", register("staff", "bench{run}-{i}@college.staff.in")),
+        ("POST /register/student/import (csv)", import_members("students", "bench{run}-import-{i}-{j}@college.student.in")),
+        ("POST /register/staff/import (csv)", import_members("staff", "bench{run}-import-{i}-{j}@college.staff.in")),
+        ("GET /student", lambda i: ("GET", "/student", {"headers": headers})),
+        ("GET /student/<id>", lambda i: ("GET", f"/student/{cycle(student_ids, i)}", {"headers": headers})),
+        ("GET /student/<id>/dashboard", lambda i: (
+            "GET", f"/student/{cycle(student_ids, i)}/dashboard", {"headers": headers})),
+        ("PUT /student/<id>", lambda i: (
+            "PUT", f"/student/{cycle(student_ids, i)}", {"json": {"name": f"Renamed {i}"}, "headers": headers})),
+        ("PUT /student/cohort (promote, dry run)", lambda i: (
+            "PUT", "/student/cohort", {"json": {"cohort": cohort, "promote": True, "dry_run": True}, "headers": headers})),
+        ("DELETE /student/<id>", delete("students", "/student")),
+        ("GET /staff", lambda i: ("GET", "/staff", {"headers": headers})),
+        ("GET /staff/<id>", lambda i: ("GET", f"/staff/{cycle(staff_ids, i)}", {"headers": headers})),
+        ("PUT /staff/<id>", lambda i: (
+            "PUT", f"/staff/{cycle(staff_ids, i)}", {"json": {"name": f"Renamed {i}"}, "headers": headers})),
+        ("DELETE /staff/<id>", delete("staff", "/staff")),
+        ("GET /attendance", lambda i: ("GET", "/attendance", {"headers": headers})),
+        ("POST /attendance", lambda i: (
+            "POST", "/attendance",
+            {"json": {"student_id": cycle(student_ids, i), "date": day(i), "present": True}, "headers": headers})),
+        ("POST /attendance/bulk (cohort)", lambda i: (
+            "POST", "/attendance/bulk",
+            {"json": {"date": day(i), "cohort": cohort, "present": True}, "headers": headers})),
+        ("GET /attendance/range (week, cohort)", lambda i: (
+            "GET", "/attendance/range",
+            {"query_string": {**cohort, "from": week(i), "to": week(i, 6)}, "headers": headers})),
+        ("GET /attendance/export (week, cohort, csv)", lambda i: (
+            "GET", "/attendance/export",
+            {"query_string": {**cohort, "from": week(i), "to": week(i, 6)}, "headers": headers})),
+        ("GET /attendance/date/<date>", lambda i: ("GET", f"/attendance/date/{week(i)}", {"headers": headers})),
+        ("GET /attendance/<student_id>", lambda i: (
+            "GET", f"/attendance/{cycle(student_ids, i)}", {"headers": headers})),
+        ("GET /attendance/summary/student/<id>", lambda i: (
+            "GET", f"/attendance/summary/student/{cycle(student_ids, i)}", {"headers": headers})),
+        ("GET /attendance/summary/cohort", lambda i: (
+            "GET", "/attendance/summary/cohort", {"query_string": cohort, "headers": headers})),
+    ], registered
+
+
+def run_scenario(client, prepare, iterations, registered):
+    durations, statuses = [], Counter()
+    for i in range(iterations):
+        method, url, kwargs = prepare(i)
+        record = kwargs.pop("_record", None)
+        start = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        # Consume streamed bodies inside the timed section.
+        response.get_data()
+        durations.append(time.perf_counter() - start)
+        statuses[response.status_code] += 1
+        if record and response.status_code == 200:
+            registered[record].append(json.loads(response.data)["id"]["$oid"])
+    return {**summarize(durations), "statuses": dict(statuses), "peak_rss_mb": peak_rss_mb()}
+
+
+def compare(results, baseline):
+    print(f"{'route':40} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (current[key] / previous[key] - 1) * 100 if previous[key] else 0
+            cells.append(f"{previous[key]:.2f}->{current[key]:.2f} {change:+.0f}%")
+        print(f"{name:40} " + " ".join(f"{cell:>18}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--staff", type=int, default=50)
+    parser.add_argument("--attendance", type=int, default=60000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--only", help="run only the routes whose name contains this text")
+    parser.add_argument("--mongomock", action="store_true")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="a previous result file to compare against")
+    args = parser.parse_args()
+
+    app = create_app(use_mongomock=args.mongomock)
+    from db import mongo
+
+    data = populate(
+        mongo.db, args.students, args.staff, args.attendance, args.seed,
+        storage=app.config["ATTENDANCE_STORAGE"], rounds=app.config["PASSWORD_HASH_ROUNDS"],
+        # mongomock has no $merge, so summaries are only rebuilt on a real server.
+        summaries=not args.mongomock,
+    )
+    with app.app_context():
+        from flask_jwt_extended import create_access_token
+        headers = {"Authorization": f"Bearer {create_access_token(identity=str(data['staff_ids'][0]), fresh=True)}"}
+    client = app.test_client()
+    scenarios, registered = build_scenarios(app, headers, data)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "backend": "mongomock" if args.mongomock else "mongod",
+        "attendance_storage": app.config["ATTENDANCE_STORAGE"],
+        "iterations": args.iterations,
+        "dataset": {key: value for key, value in data.items() if not key.endswith("_ids")},
+        "scenarios": {},
+    }
+    for name, prepare in scenarios:
+        if args.only and args.only not in name:
+            continue
+        results["scenarios"][name] = run_scenario(client, prepare, args.iterations, registered)
+        print(f"{name:40} {json.dumps(results['scenarios'][name])}")
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    output = args.output or os.path.join("benchmarks", "results", f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare renewing a session with POST /login (pbkdf2 verify) against POST
+/refresh (signature check plus one rotation write), in wall time and CPU.
+
+Password hashing runs inline (PASSWORD_HASH_WORKERS=0) so the pbkdf2 CPU is
+counted in this process.
+
+Usage:
+    python -m benchmarks.token_refresh [--sessions 200] [--mongomock]
+"""
+import argparse
+import json
+import os
+import time
+from benchmarks.harness import create_app, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    os.environ["PASSWORD_HASH_WORKERS"] = "0"
+    app = create_app(use_mongomock=args.mongomock)
+    from passlib.hash import pbkdf2_sha256
+    from db import mongo
+
+    email = f"refresh{time.time_ns()}@college.staff.in"
+    mongo.db.staff.insert_one({
+        "name": "Refresh Benchmark", "email": email, "phone": 9000000000, "dept": "ADMIN",
+        "password": pbkdf2_sha256.using(rounds=app.config["PASSWORD_HASH_ROUNDS"]).hash("benchmark"),
+    })
+    client = app.test_client()
+    login = {"email": email, "password": "benchmark"}
+
+    def measure(request):
+        durations, cpu_start = [], time.process_time()
+        for _ in range(args.sessions):
+            start = time.perf_counter()
+            response = request()
+            durations.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        cpu = time.process_time() - cpu_start
+        return {**summarize(durations), "cpu_ms_per_session": round(cpu / args.sessions * 1000, 3)}
+
+    relogin = measure(lambda: client.post("/login", json=login))
+
+    refresh_token = client.post("/login", json=login).get_json()["refresh_token"]
+
+    def refresh():
+        nonlocal refresh_token
+        response = client.post("/refresh", headers={"Authorization": f"Bearer {refresh_token}"})
+        refresh_token = response.get_json().get("refresh_token") or refresh_token
+        return response
+
+    refreshed = measure(refresh)
+    print(json.dumps({
+        "sessions": args.sessions,
+        "pbkdf2_rounds": app.config["PASSWORD_HASH_ROUNDS"],
+        "rotation": app.config["REFRESH_TOKEN_ROTATION"],
+        "login": relogin,
+        "refresh": refreshed,
+        "cpu_saved_ms_per_session": round(relogin["cpu_ms_per_session"] - refreshed["cpu_ms_per_session"], 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
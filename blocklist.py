@@ -1 +1,155 @@
-BLOCKLIST= set()
\ No newline at end of file
+import datetime
+import hashlib
+import math
+import threading
+import time
+from pymongo.errors import PyMongoError
+from db import mongo
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
+
+BLOCKLIST_COLLECTION = "token_blocklist"
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings: no false negatives, and false
+    positives at about `error_rate` while holding up to `capacity` items.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenBlocklist:
+    """
+    Revoked token ids shared by every worker through MongoDB.
+
+    Each revocation is stored in `token_blocklist` with the token's expiry, and
+    a TTL index removes it once the token could not be used anyway. Workers keep
+    a Bloom filter of the revoked ids, refreshed from the collection every
+    `refresh_interval` seconds and rebuilt every `rebuild_interval` seconds to
+    forget expired ids, so the common "not revoked" check needs no database
+    round trip. A Bloom hit is confirmed against the worker's own recent
+    revocations or the collection.
+
+    A token revoked on another worker is rejected here within `refresh_interval`.
+    When the collection cannot be reached to confirm a token, the check fails
+    closed: the token is treated as revoked, since honouring a revoked token
+    is worse than rejecting requests while the database is down.
+
+    `revoked_at` is set by the server with $currentDate, and each refresh loads
+    the revocations stamped no earlier than `sync_overlap` seconds before the
+    latest stamp already seen, so worker clocks play no part and a write that
+    commits after a later-stamped one is still picked up.
+    """
+
+    def __init__(self, refresh_interval=5, rebuild_interval=3600, capacity=100000, error_rate=0.001,
+                 sync_overlap=5):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._recent = {}
+        self._last_revoked_at = None
+        self._refreshed = 0
+        self._rebuilt = 0
+        self.configure(refresh_interval, rebuild_interval, capacity, error_rate, sync_overlap)
+
+    def configure(self, refresh_interval=None, rebuild_interval=None, capacity=None, error_rate=None,
+                  sync_overlap=None):
+        with self._lock:
+            if refresh_interval is not None:
+                self.refresh_interval = refresh_interval
+            if rebuild_interval is not None:
+                self.rebuild_interval = rebuild_interval
+            if sync_overlap is not None:
+                self.sync_overlap = sync_overlap
+            if capacity is not None:
+                self.capacity = capacity
+            if error_rate is not None:
+                self.error_rate = error_rate
+            self._bloom = None
+
+    @property
+    def collection(self):
+        return mongo.db[BLOCKLIST_COLLECTION]
+
+    def add(self, jti, expires_at=None):
+        """
+        Revoke `jti` until `expires_at` (a naive UTC datetime), defaulting to a day from now.
+        """
+        now = datetime.datetime.utcnow()
+        expires_at = expires_at or now + datetime.timedelta(days=1)
+        self.collection.update_one(
+            {"_id": jti},
+            {"$set": {"expires_at": expires_at}, "$currentDate": {"revoked_at": True}},
+            upsert=True,
+        )
+        with self._lock:
+            self._recent[jti] = expires_at
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def _sync(self):
+        """
+        Load revocations made since the last sync, or all of them when the
+        filter is due for a rebuild. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        rebuild = self._bloom is None or now - self._rebuilt >= self.rebuild_interval
+        if not rebuild and now - self._refreshed < self.refresh_interval:
+            return
+        started = datetime.datetime.utcnow()
+        query = {"expires_at": {"$gt": started}}
+        last_revoked_at = None if rebuild else self._last_revoked_at
+        if last_revoked_at is not None:
+            query["revoked_at"] = {"$gte": last_revoked_at - datetime.timedelta(seconds=self.sync_overlap)}
+        bloom = BloomFilter(self.capacity, self.error_rate) if rebuild else self._bloom
+        for revoked in self.collection.find(query, {"_id": 1, "revoked_at": 1}):
+            bloom.add(revoked["_id"])
+            if revoked.get("revoked_at") and (last_revoked_at is None or revoked["revoked_at"] > last_revoked_at):
+                last_revoked_at = revoked["revoked_at"]
+        for jti in self._recent:
+            bloom.add(jti)
+        self._recent = {jti: expires for jti, expires in self._recent.items() if expires > started}
+        self._bloom, self._last_revoked_at, self._refreshed = bloom, last_revoked_at, now
+        if rebuild:
+            self._rebuilt = now
+
+    def _lookup(self, jti):
+        try:
+            return self.collection.find_one({"_id": jti}, {"_id": 1}) is not None
+        except PyMongoError as e:
+            logger.error("Could not check token %s against the blocklist, treating it as revoked: %s", jti, e)
+            return True
+
+    def __contains__(self, jti):
+        with self._lock:
+            try:
+                self._sync()
+            except Exception as e:
+                logger.error("Could not refresh the token blocklist: %s", e)
+                if self._bloom is None:
+                    return jti in self._recent or self._lookup(jti)
+            if jti not in self._bloom:
+                return False
+            if jti in self._recent:
+                return True
+        return self._lookup(jti)
+
+
+BLOCKLIST = TokenBlocklist()
@@ -0,0 +1,149 @@
+import codecs
+import csv
+import datetime
+import itertools
+import json
+from marshmallow import ValidationError
+from pymongo.errors import BulkWriteError
+from models.schema import PlainStaffSchema, PlainStudentSchema
+from passwords import PASSWORD_HASHER
+from response_cache import RESPONSE_CACHE
+from role_cache import ROLE_CACHE
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
+
+# kind -> (collection, schema of one row)
+KINDS = {
+    "students": ("students", PlainStudentSchema),
+    "staff": ("staff", PlainStaffSchema),
+}
+FORMATS = ("csv", "ndjson")
+DUPLICATE_KEY = 11000
+
+
+def detect_format(filename=None, content_type=None):
+    """
+    Guess "csv" or "ndjson" from an upload's file name or content type; CSV by default.
+    """
+    if (filename or "").lower().endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+
+def read_rows(stream, fmt="csv"):
+    """
+    Yield (row_number, row) from a binary stream one line at a time.
+
+    CSV rows are keyed by the header line and empty cells are dropped so
+    optional fields fall back to their defaults. Unparseable NDJSON lines are
+    yielded as the exception raised for them.
+    """
+    lines = codecs.iterdecode(stream, "utf-8-sig")
+    if fmt == "ndjson":
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = e
+            yield number, row if isinstance(row, (dict, Exception)) else ValueError("Expected a JSON object.")
+        return
+    # The header is line 1, so data rows are numbered from 2 like in a spreadsheet.
+    for number, row in enumerate(csv.DictReader(lines), start=2):
+        if None in row:
+            yield number, ValueError("More cells than header columns.")
+            continue
+        yield number, {key.strip(): value for key, value in row.items() if value not in (None, "")}
+
+
+def _import_chunk(collection, schema, chunk, report):
+    """
+    Validate, de-duplicate, hash and insert one chunk of (row_number, row) pairs.
+    """
+    def fail(number, row, status, errors):
+        report[status] += 1
+        email = row.get("email") if isinstance(row, dict) else None
+        report["errors"].append({"row": number, "email": email, "status": status, "errors": errors})
+
+    parsed = [(number, row) for number, row in chunk if isinstance(row, dict)]
+    for number, row in chunk:
+        if not isinstance(row, dict):
+            fail(number, None, "invalid", {"_row": [str(row)]})
+    try:
+        loaded, errors = schema(many=True).load([row for _, row in parsed]), {}
+    except ValidationError as e:
+        loaded, errors = e.valid_data, e.messages
+
+    candidates = []
+    for index, (number, row) in enumerate(parsed):
+        if index in errors:
+            fail(number, row, "invalid", errors[index])
+        else:
+            candidates.append((number, loaded[index]))
+
+    # One round trip for the emails already registered, plus repeats within the chunk.
+    emails = [member["email"] for _, member in candidates]
+    taken = {member["email"] for member in collection.find({"email": {"$in": emails}}, {"email": 1})}
+    fresh = []
+    for number, member in candidates:
+        if member["email"] in taken:
+            fail(number, member, "duplicate", {"email": ["email already exists"]})
+        else:
+            taken.add(member["email"])
+            fresh.append((number, member))
+    if not fresh:
+        return []
+
+    now = datetime.datetime.now()
+    hashes = PASSWORD_HASHER.hash_many([member["password"] for _, member in fresh])
+    documents = [{**member, "password": hashed, "created_at": now} for (_, member), hashed in zip(fresh, hashes)]
+    try:
+        result = collection.insert_many(documents, ordered=False)
+        inserted = result.inserted_ids
+    except BulkWriteError as e:
+        # Rows that lost a race with another writer, or an email repeated in an
+        # earlier chunk, are rejected by the unique email index.
+        failed = set()
+        for error in e.details["writeErrors"]:
+            number, member = fresh[error["index"]]
+            failed.add(error["index"])
+            if error["code"] == DUPLICATE_KEY:
+                fail(number, member, "duplicate", {"email": ["email already exists"]})
+            else:
+                fail(number, member, "error", {"_row": [error["errmsg"]]})
+        inserted = [document["_id"] for index, document in enumerate(documents) if index not in failed]
+    report["inserted"] += len(inserted)
+    return inserted
+
+
+def import_members(db, kind, rows, chunk_size=500):
+    """
+    Insert students or staff from an iterable of (row_number, row) pairs.
+
+    Rows are processed `chunk_size` at a time: validated with the registration
+    schema, checked for existing emails with one $in query, hashed on the
+    password pool and written with an unordered insert_many. Only the current
+    chunk is held in memory.
+
+    Returns:
+        A dict with inserted/invalid/duplicate/error totals and an `errors`
+        list of {"row", "email", "status", "errors"} for every rejected row.
+    """
+    collection_name, schema = KINDS[kind]
+    collection = db[collection_name]
+    report = {"inserted": 0, "invalid": 0, "duplicate": 0, "error": 0, "errors": []}
+    rows = iter(rows)
+    for chunk in iter(lambda: list(itertools.islice(rows, chunk_size)), []):
+        inserted = _import_chunk(collection, schema, chunk, report)
+        if inserted:
+            RESPONSE_CACHE.bump(collection_name)
+        if kind == "staff":
+            for staff_id in inserted:
+                ROLE_CACHE.invalidate(staff_id)
+    logger.info(
+        "Imported %s: %s inserted, %s invalid, %s duplicate, %s failed.",
+        kind, report["inserted"], report["invalid"], report["duplicate"], report["error"],
+    )
+    return report
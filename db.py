@@ -1,4 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
 from flask_pymongo import PyMongo
 
 # Initialize the PyMongo object
 mongo = PyMongo()
+
+
+def pool_options(config):
+    """
+    PyMongo connection pool options taken from the app config.
+    """
+    return {
+        "maxPoolSize": config["MONGO_MAX_POOL_SIZE"],
+        "minPoolSize": config["MONGO_MIN_POOL_SIZE"],
+        "waitQueueTimeoutMS": config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+    }
+
+
+def client_options(config):
+    """
+    Keyword arguments for `mongo.init_app`: the pool options, plus the
+    command listener that feeds /metrics when METRICS_ENABLED is on.
+    """
+    options = pool_options(config)
+    if config["METRICS_ENABLED"]:
+        from metrics import MONGO_COMMAND_METRICS
+        options["event_listeners"] = [MONGO_COMMAND_METRICS]
+    return options
+
+
+def warm_up_pool(connections):
+    """
+    Open up to `connections` pooled connections by running that many pings
+    concurrently, so the first requests do not pay for connection setup.
+    Call it after forking, in the process that will serve requests.
+    """
+    connections = max(connections, 1)
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        list(executor.map(lambda _: mongo.cx.admin.command("ping"), range(connections)))
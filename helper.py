@@ -1,9 +1,31 @@
+import base64
+import binascii
+import datetime
 from functools import wraps
-from bson import ObjectId
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
 from flask_smorest import abort
-from flask import request, jsonify
+from flask import Response, current_app, request, jsonify
 from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
 from db import mongo
+from role_cache import ROLE_CACHE
+from serializer import dumps
+
+def lookup_role(staff_id):
+    """
+    Return {"is_staff", "is_admin"} for `staff_id`, going to MongoDB only on a cache miss.
+    """
+    role = ROLE_CACHE.get(staff_id)
+    if role is None:
+        try:
+            staff = mongo.db.staff.find_one({"_id": ObjectId(staff_id)}, {"is_admin": 1})
+        except InvalidId:
+            staff = None
+        role = {"is_staff": staff is not None, "is_admin": bool(staff) and staff.get("is_admin") == 1}
+        ROLE_CACHE.set(staff_id, role)
+    return role
+
 
 def authorize(permission):
     def decorator(fn):
@@ -11,18 +33,223 @@ def authorize(permission):
         def wrapper(*args, **kwargs):
             verify_jwt_in_request()  # Ensure JWT is valid
             current_user = get_jwt_identity()
-            print(current_user)
 
-            user= None
+            claims = get_jwt()
+            if current_app.config["ROLE_CLAIMS_IN_JWT"] and "is_staff" in claims:
+                role = {"is_staff": claims["is_staff"], "is_admin": claims["is_admin"]}
+            else:
+                role = lookup_role(current_user)
+
+            allowed = False
             if permission =="staff":
-                user = mongo.db.staff.find_one({"_id": ObjectId(current_user)})
+                allowed = role["is_staff"]
             if permission =="admin":
-                user = mongo.db.staff.find_one({"_id": ObjectId(current_user),"is_admin":1})
+                allowed = role["is_admin"]
+            # A student may read their own records, staff may read anyone's.
+            if permission =="self_or_staff":
+                allowed = current_user == kwargs.get("student_id") or role["is_staff"]
 
-            if not user:
+            if not allowed:
                 abort(403, message="You do not have the required permission.")
 
             return fn(*args, **kwargs)
         return wrapper
     return decorator
 
+
+def encode_cursor(values):
+    """
+    Encode the sort key values of the last document of a page into an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor, aborting with 400 if it was tampered with.
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        abort(400, message="Invalid pagination cursor.")
+    # Values go straight into the keyset filter, so anything but a scalar
+    # (e.g. {"$exists": true}) would be read as a query operator.
+    if not isinstance(values, list) or any(isinstance(value, (dict, list)) for value in values):
+        abort(400, message="Invalid pagination cursor.")
+    return values
+
+
+def keyset_filter(keys, values):
+    """
+    Build the filter that selects documents sorted strictly after `values` on `keys`.
+
+    For keys (a, b) this is: a > va OR (a == va AND b > vb).
+    """
+    clauses = []
+    for i, key in enumerate(keys):
+        clause = {k: values[j] for j, k in enumerate(keys[:i])}
+        clause[key] = {"$gt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def keyset_query(args, query=None, keys=("_id",)):
+    """
+    Combine the base `query` with the position encoded in `args["after"]`.
+    """
+    query = dict(query or {})
+    if args.get("after"):
+        values = decode_cursor(args["after"])
+        if len(values) != len(keys):
+            abort(400, message="Invalid pagination cursor.")
+        after = keyset_filter(keys, values)
+        query = {"$and": [query, after]} if query else after
+    return query
+
+
+def page_size(args):
+    """
+    The requested page size, defaulted and capped by the server-side limits.
+    """
+    return min(args.get("limit") or current_app.config["PAGE_SIZE_DEFAULT"], current_app.config["PAGE_SIZE_MAX"])
+
+
+def paginate(collection, args, query=None, keys=("_id",), projection=None):
+    """
+    Fetch one page of `collection` using keyset pagination.
+
+    Documents are sorted on `keys` (which must end with a unique field) and the
+    page starts strictly after the position encoded in `args["after"]`, so the
+    cost of a page does not depend on how deep the client has paged.
+
+    Args:
+        collection: The PyMongo collection to read from.
+        args (dict): Parsed PaginationSchema arguments (`limit`, `after`).
+        query (dict): Optional base filter.
+        keys (tuple): Sort keys, the last one being unique.
+        projection (dict): Optional projection passed to find().
+
+    Returns:
+        A tuple (documents, next_cursor); next_cursor is None on the last page.
+    """
+    limit = page_size(args)
+    query = keyset_query(args, query, keys)
+
+    cursor = collection.find(query, projection).sort([(key, 1) for key in keys]).limit(limit + 1)
+    documents = list(cursor)
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor([documents[-1].get(key) for key in keys])
+    return documents, next_cursor
+
+
+def wants_stream(args):
+    """
+    True when the client asked for NDJSON, either with `?stream=1` or the Accept header.
+    """
+    if args.get("stream"):
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"])
+    return best == "application/x-ndjson"
+
+
+def stream_ndjson(collection, args, query=None, keys=("_id",), projection=None):
+    """
+    Stream every matching document as newline-delimited JSON.
+
+    Documents are pulled from the PyMongo cursor `STREAM_BATCH_SIZE` at a time
+    and serialized one by one, so memory stays flat whatever the collection
+    size. An `after` cursor may be given to resume an interrupted export.
+    """
+    query = keyset_query(args, query, keys)
+    cursor = collection.find(query, projection).sort([(key, 1) for key in keys])
+    return ndjson_response(cursor.batch_size(current_app.config["STREAM_BATCH_SIZE"]))
+
+
+def ndjson_response(documents):
+    """
+    Build a streaming NDJSON response that serializes `documents` one at a time.
+    """
+    def generate():
+        try:
+            for document in documents:
+                yield dumps(document) + "\n"
+        finally:
+            if hasattr(documents, "close"):
+                documents.close()
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+# Fields that make up a student or staff document's ETag.
+ETAG_PROJECTION = {"version": 1, "updated_at": 1, "created_at": 1}
+
+
+def document_etag(document):
+    """
+    Strong ETag of a student or staff document.
+
+    Every write through the API increments `version` and sets `updated_at`;
+    the timestamp keeps tags distinct for documents written before versioning.
+    """
+    stamp = document.get("updated_at") or document.get("created_at")
+    micros = int(stamp.timestamp() * 1000000) if isinstance(stamp, datetime.datetime) else 0
+    return f"{document.get('version', 0)}-{micros:x}"
+
+
+def etag_headers(document):
+    return {"ETag": f'"{document_etag(document)}"'}
+
+
+def not_modified(collection, query):
+    """
+    Answer a conditional GET from a projection-only lookup.
+
+    Returns a 304 response when the client's If-None-Match still matches the
+    document, or None when the caller should read and return it in full.
+    """
+    if not request.if_none_match:
+        return None
+    current = collection.find_one_or_404(query, ETAG_PROJECTION)
+    etag = document_etag(current)
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+    return None
+
+
+def if_match_filter(collection, query):
+    """
+    Extend an update filter so it only applies to the version named in If-Match.
+
+    Aborts with 412 when the document has already moved on. The returned
+    filter also pins the version read here, so a write racing in between
+    makes the update match nothing instead of being overwritten.
+    """
+    if not request.if_match:
+        return query
+    current = collection.find_one_or_404(query, ETAG_PROJECTION)
+    if not request.if_match.contains(document_etag(current)):
+        abort(412, message="The resource has changed since it was fetched.")
+    return {**query, "version": current.get("version"), "updated_at": current.get("updated_at")}
+
+
+def update_document(collection, query, update, projection=None):
+    """
+    Apply `update` to the document matching `query` and return its post-image
+    in the same round trip, without the password hash.
+
+    Aborts with 404 when nothing matched, or 412 when the request carried
+    If-Match (the filter from if_match_filter no longer matches).
+    """
+    document = collection.find_one_and_update(
+        query,
+        update,
+        projection=projection or {"password": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if document is None:
+        if request.if_match:
+            abort(412, message="The resource has changed since it was fetched.")
+        abort(404, message="Not found.")
+    return document
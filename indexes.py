@@ -0,0 +1,134 @@
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Every index the application relies on, per collection. Names are explicit so
+# that drift can be reported by name and indexes can be dropped deliberately.
+INDEXES = {
+    "students": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # Back the cohort and name prefix filters of GET /student; the trailing
+        # _id serves the keyset order of its pages.
+        IndexModel(
+            [("dept", ASCENDING), ("batch", ASCENDING), ("sem", ASCENDING), ("_id", ASCENDING)],
+            name="dept_batch_sem_id",
+        ),
+        IndexModel([("name", ASCENDING), ("_id", ASCENDING)], name="name_id"),
+    ],
+    "staff": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "attendance": [
+        IndexModel([("student_id", ASCENDING), ("date", ASCENDING)], name="student_id_date"),
+        # Serves date-range reads, including the (date, student_id, _id) keyset of their pages.
+        IndexModel([("date", ASCENDING), ("student_id", ASCENDING), ("_id", ASCENDING)], name="date_student_id_id"),
+        IndexModel([("date", ASCENDING), ("_id", ASCENDING)], name="date_id"),
+    ],
+    "attendance_buckets": [
+        IndexModel([("student_id", ASCENDING), ("month", ASCENDING)], name="student_id_month"),
+        IndexModel([("month", ASCENDING), ("_id", ASCENDING)], name="month_id"),
+    ],
+    "token_blocklist": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("revoked_at", ASCENDING)], name="revoked_at"),
+    ],
+    "refresh_tokens": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("family", ASCENDING)], name="family"),
+        # Finds the login of an access token on logout.
+        IndexModel([("access_jti", ASCENDING)], name="access_jti"),
+    ],
+    "attendance_summary": [
+        IndexModel([("student_id", ASCENDING), ("period", ASCENDING)], name="student_id_period", sparse=True),
+    ],
+}
+
+# Options compared when checking an existing index against its declaration.
+_COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def ensure_indexes(db, registry=None):
+    """
+    Create every declared index. create_indexes is a no-op for indexes that
+    already exist with the same definition, so this is safe to run on every boot.
+
+    Args:
+        db: The PyMongo database.
+        registry (dict): Collection name to IndexModel list, defaults to INDEXES.
+
+    Returns:
+        A dict of collection name to the index names that were ensured.
+    """
+    created = {}
+    for collection, models in (registry or INDEXES).items():
+        created[collection] = db[collection].create_indexes(models)
+        logger.info("Ensured indexes on %s: %s", collection, created[collection])
+    return created
+
+
+def check_indexes(db, registry=None):
+    """
+    Compare the indexes present in MongoDB with the declared ones.
+
+    Returns:
+        A dict of collection name to {"missing", "changed", "unexpected"} index
+        names, containing only collections that drifted.
+    """
+    drift = {}
+    for collection, models in (registry or INDEXES).items():
+        existing = db[collection].index_information()
+        existing.pop("_id_", None)
+        report = {"missing": [], "changed": [], "unexpected": []}
+        for model in models:
+            declared = model.document
+            name = declared["name"]
+            actual = existing.pop(name, None)
+            if actual is None:
+                report["missing"].append(name)
+                continue
+            same_keys = list(declared["key"].items()) == [tuple(key) for key in actual["key"]]
+            same_options = all(declared.get(option) == actual.get(option) for option in _COMPARED_OPTIONS)
+            if not (same_keys and same_options):
+                report["changed"].append(name)
+        report["unexpected"] = sorted(existing)
+        if any(report.values()):
+            drift[collection] = report
+    return drift
+
+
+def sync_indexes(db):
+    """
+    Ensure the declared indexes at startup and log any drift, without letting
+    an unreachable or misconfigured database stop the app from booting.
+    """
+    try:
+        ensure_indexes(db)
+        drift = check_indexes(db)
+    except PyMongoError as e:
+        logger.error("Could not ensure MongoDB indexes: %s", e)
+        return None
+    for collection, report in drift.items():
+        logger.warning("Index drift on %s: %s", collection, report)
+    return drift
+
+
+def plan_stages(plan):
+    """
+    The stages of an explain() winning plan, outermost first, as
+    (stage, indexName) pairs; indexName is None for stages other than IXSCAN.
+    """
+    plan = plan.get("queryPlan", plan)
+    stages = [(plan.get("stage"), plan.get("indexName"))]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+
+def explain_stages(cursor):
+    """
+    Run explain() on a PyMongo cursor and return its winning plan's (stage, indexName) pairs.
+    """
+    return plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
@@ -1,20 +1,187 @@
+import atexit
+import datetime
+import json
 import logging
+import logging.handlers
+import os
+import queue
+from dotenv import load_dotenv
+from flask import g, has_request_context
 
-#Create and configure logger using the basicConfig() function  
-logging.basicConfig(filename="logfile.log",  
-               format='%(asctime)s %(message)s',  
-               filemode='w')  
-  
-#Creating an object of the logging  
-logger=logging.getLogger()  
-
-  
-logger.setLevel(logging.DEBUG)
-
-# Suppress logs from libraries like Flask, Werkzeug, MongoDB, etc.
-# This keeps the log file cleaner, only capturing the messages you explicitly log
-logging.getLogger('werkzeug').setLevel(logging.WARNING)
-logging.getLogger('flask').setLevel(logging.WARNING)
-logging.getLogger('bson').setLevel(logging.WARNING)
-logging.getLogger('passlib').setLevel(logging.WARNING)
-logging.getLogger('pymongo').setLevel(logging.WARNING)
\ No newline at end of file
+# Logging is configured from the environment (or .env) when this module is
+# first imported:
+#
+#   LOG_FILE          path of the log file (default logfile.log); serve.py's
+#                     pre-forked workers write to "<name>.<index><ext>" files
+#   LOG_FORMAT        "text" or "json" (one JSON object per line)
+#   LOG_ROTATION      "size" (LOG_MAX_BYTES) or "time" (LOG_WHEN, e.g. "midnight")
+#   LOG_BACKUP_COUNT  number of rotated files to keep
+#   LOG_LEVEL         level of the root logger (default DEBUG)
+#   LOG_LEVELS        per-module levels, e.g. "pymongo=WARNING,routes.attendance=DEBUG"
+#
+# Request threads only put records on an in-memory queue; a QueueListener
+# thread formats them and does the file I/O. Call sites should pass
+# %-style arguments (logger.info("id %s", student_id)) so messages are only
+# formatted when a handler actually emits them.
+load_dotenv()
+
+# Libraries that are too chatty at DEBUG; LOG_LEVELS can override these.
+DEFAULT_LEVELS = {
+    "werkzeug": "WARNING",
+    "flask": "WARNING",
+    "bson": "WARNING",
+    "passlib": "WARNING",
+    "pymongo": "WARNING",
+}
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Attach the current request id (set in app.py) to every record, or "-".
+    """
+
+    def filter(self, record):
+        record.request_id = g.get("request_id", "-") if has_request_context() else "-"
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records as they are. The stock QueueHandler formats and copies each
+    record on the calling thread; here that work is left to the listener, so
+    objects passed as log arguments must not be mutated after the call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def parse_levels(value):
+    """
+    Parse "name=LEVEL,name=LEVEL" into a dict.
+    """
+    levels = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def worker_log_path(path, index):
+    """
+    The log file of worker `index`, e.g. logfile.1.log for logfile.log.
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+def build_file_handler(path=None):
+    path = path or os.environ.get("LOG_FILE", "logfile.log")
+    backups = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+    if os.environ.get("LOG_ROTATION", "size") == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=os.environ.get("LOG_WHEN", "midnight"), backupCount=backups, delay=True
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024)), backupCount=backups, delay=True
+        )
+    if os.environ.get("LOG_FORMAT", "text") == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    return handler
+
+
+queue_handler = None
+listener = None
+
+
+def start_listener(path=None):
+    """
+    Start the thread that writes queued records to `path` (LOG_FILE by default).
+    """
+    global listener
+    listener = logging.handlers.QueueListener(
+        queue_handler.queue, build_file_handler(path), respect_handler_level=True
+    )
+    listener.start()
+
+
+def stop_listener():
+    """
+    Flush and stop the listener thread; safe to call more than once.
+    """
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def use_worker_log(index, forked):
+    """
+    Send this process's records to the log file of worker `index`.
+
+    Called by serve.py in every pre-forked worker, the parent being worker 0,
+    since workers sharing one rotating file would race on rotation, losing
+    records or writing them to the renamed file. Indexes are stable across
+    restarts, so LOG_BACKUP_COUNT bounds the files kept.
+
+    In a `forked` child the listener thread did not survive fork() and the
+    inherited queue may have been left mid-operation by it, so both are
+    replaced; the parent's handler is left alone so that its buffered output
+    is not flushed a second time.
+    """
+    if forked:
+        queue_handler.queue = queue.SimpleQueue()
+    elif listener is not None:
+        handlers = listener.handlers
+        stop_listener()
+        for handler in handlers:
+            handler.close()
+    start_listener(worker_log_path(os.environ.get("LOG_FILE", "logfile.log"), index))
+
+
+def configure_logging():
+    """
+    Route the root logger through a QueueHandler and start the listener thread.
+    """
+    global queue_handler
+    queue_handler = LazyQueueHandler(queue.SimpleQueue())
+    # The request id must be read on the request thread, before queueing.
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.environ.get("LOG_LEVEL", "DEBUG").upper())
+    for name, level in {**DEFAULT_LEVELS, **parse_levels(os.environ.get("LOG_LEVELS"))}.items():
+        logging.getLogger(name).setLevel(level)
+
+    start_listener()
+    atexit.register(stop_listener)
+    return listener
+
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+
+configure_logging()
+
+# The root logger, for modules that do not need their own level.
+logger = logging.getLogger()
@@ -0,0 +1,269 @@
+import threading
+import time
+from collections import defaultdict
+from flask import Response, g, request
+from pymongo import monitoring
+from attendance_buffer import ATTENDANCE_BUFFER
+from log_services.logger import get_logger
+from response_cache import RESPONSE_CACHE
+from role_cache import ROLE_CACHE
+
+logger = get_logger(__name__)
+
+# Latency buckets in seconds, shared by the HTTP and MongoDB histograms.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name, self.description, self.labels = name, description, labels
+        self.values = defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=BUCKETS):
+        self.name, self.description, self.labels, self.buckets = name, description, labels, buckets
+        self.counts = defaultdict(lambda: [0] * len(self.buckets))
+        self.sums = defaultdict(float)
+        self.totals = defaultdict(int)
+
+    def observe(self, value, *labels):
+        counts = self.counts[labels]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self.sums[labels] += value
+        self.totals[labels] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels in sorted(self.totals):
+            cumulative = 0
+            for bound, count in zip(self.buckets, self.counts[labels]):
+                cumulative += count
+                bucket = _labels(self.labels, labels, 'le="%g"' % bound)
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            bucket = _labels(self.labels, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket} {self.totals[labels]}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {self.sums[labels]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {self.totals[labels]}")
+        return lines
+
+
+class Registry:
+    """
+    The process-wide set of metrics. Values are per process: with several
+    server workers each one exposes its own numbers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+        self.collectors = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self.lock:
+            lines = [line for metric in self.metrics for line in metric.render()]
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.add(Counter(
+    "http_requests_total", "HTTP requests by endpoint, method and status.", ("endpoint", "method", "status")))
+HTTP_LATENCY = REGISTRY.add(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response is returned.", ("endpoint", "method")))
+HTTP_IN_FLIGHT = REGISTRY.add(Gauge("http_requests_in_flight", "HTTP requests being handled."))
+MONGO_LATENCY = REGISTRY.add(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency.", ("collection", "command")))
+MONGO_DOCUMENTS = REGISTRY.add(Counter(
+    "mongodb_command_documents_total", "Documents returned or written by MongoDB commands.", ("collection", "command")))
+MONGO_FAILURES = REGISTRY.add(Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands.", ("collection", "command")))
+ATTENDANCE_FLUSH_LATENCY = REGISTRY.add(Histogram(
+    "attendance_buffer_flush_duration_seconds", "Time to write one batch of the attendance write-behind buffer."))
+ATTENDANCE_FLUSHED = REGISTRY.add(Counter(
+    "attendance_buffer_records_total", "Records flushed by the attendance write-behind buffer by result.", ("result",)))
+
+
+def _document_count(command_name, reply):
+    if command_name in ("find", "aggregate"):
+        return len(reply.get("cursor", {}).get("firstBatch", ()))
+    if command_name == "getMore":
+        return len(reply.get("cursor", {}).get("nextBatch", ()))
+    if command_name in ("insert", "update", "delete"):
+        return reply.get("n", 0)
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Records the duration and document count of every MongoDB command per
+    collection. Register it when the MongoClient is created.
+    """
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get("collection") if event.command_name == "getMore" \
+            else event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = \
+                collection if isinstance(collection, str) else "-"
+
+    def _finish(self, event):
+        with self._lock:
+            return self._collections.pop((event.connection_id, event.request_id), "-")
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        with REGISTRY.lock:
+            MONGO_LATENCY.observe(event.duration_micros / 1e6, collection, event.command_name)
+            MONGO_DOCUMENTS.inc(collection, event.command_name,
+                                amount=_document_count(event.command_name, event.reply))
+
+    def failed(self, event):
+        collection = self._finish(event)
+        with REGISTRY.lock:
+            MONGO_LATENCY.observe(event.duration_micros / 1e6, collection, event.command_name)
+            MONGO_FAILURES.inc(collection, event.command_name)
+
+
+MONGO_COMMAND_METRICS = CommandMetrics()
+
+
+def _role_cache_metrics():
+    stats = ROLE_CACHE.stats()
+    return [
+        "# HELP role_cache_requests_total Role cache lookups by result.",
+        "# TYPE role_cache_requests_total counter",
+        f'role_cache_requests_total{{result="hit"}} {stats["hits"]}',
+        f'role_cache_requests_total{{result="miss"}} {stats["misses"]}',
+        "# HELP role_cache_entries Staff roles currently cached.",
+        "# TYPE role_cache_entries gauge",
+        f"role_cache_entries {stats['size']}",
+    ]
+
+
+def _response_cache_metrics():
+    stats = RESPONSE_CACHE.stats()
+    return [
+        "# HELP response_cache_requests_total Response cache lookups by result.",
+        "# TYPE response_cache_requests_total counter",
+        f'response_cache_requests_total{{result="hit"}} {stats["hits"]}',
+        f'response_cache_requests_total{{result="miss"}} {stats["misses"]}',
+        "# HELP response_cache_bytes Approximate size of the cached responses.",
+        "# TYPE response_cache_bytes gauge",
+        f"response_cache_bytes {stats['bytes']}",
+    ]
+
+
+def _attendance_buffer_metrics():
+    return [
+        "# HELP attendance_buffer_depth Attendance records waiting in the write-behind buffer.",
+        "# TYPE attendance_buffer_depth gauge",
+        f"attendance_buffer_depth {ATTENDANCE_BUFFER.depth()}",
+        "# HELP attendance_buffer_capacity Records the write-behind buffer holds before rejecting posts.",
+        "# TYPE attendance_buffer_capacity gauge",
+        f"attendance_buffer_capacity {ATTENDANCE_BUFFER.max_queue}",
+    ]
+
+
+def _observe_attendance_flush(seconds, written, failed):
+    with REGISTRY.lock:
+        ATTENDANCE_FLUSH_LATENCY.observe(seconds)
+        ATTENDANCE_FLUSHED.inc("written", amount=written)
+        if failed:
+            ATTENDANCE_FLUSHED.inc("failed", amount=failed)
+
+
+REGISTRY.collectors.append(_role_cache_metrics)
+REGISTRY.collectors.append(_response_cache_metrics)
+REGISTRY.collectors.append(_attendance_buffer_metrics)
+ATTENDANCE_BUFFER.flush_listeners.append(_observe_attendance_flush)
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+    with REGISTRY.lock:
+        HTTP_IN_FLIGHT.inc()
+
+
+def _finish_request(endpoint, method, status, app):
+    elapsed = time.perf_counter() - g.pop("metrics_started")
+    with REGISTRY.lock:
+        HTTP_IN_FLIGHT.inc(amount=-1)
+        HTTP_REQUESTS.inc(endpoint, method, str(status))
+        HTTP_LATENCY.observe(elapsed, endpoint, method)
+    threshold = app.config["SLOW_REQUEST_MS"]
+    if threshold and elapsed * 1000 >= threshold:
+        logger.warning("Slow request %s %s took %.1f ms (status %s)", method, request.full_path, elapsed * 1000, status)
+
+
+def init_app(app):
+    """
+    Record request metrics for `app` and serve them at /metrics in the
+    Prometheus text format.
+    """
+
+    def endpoint():
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    @app.before_request
+    def start_request_timer():
+        _start_timer()
+
+    @app.after_request
+    def record_request(response):
+        if "metrics_started" in g:
+            _finish_request(endpoint(), request.method, response.status_code, app)
+        return response
+
+    @app.teardown_request
+    def record_failed_request(error):
+        # Only reached with the timer still running when after_request was skipped.
+        if "metrics_started" in g:
+            _finish_request(endpoint(), request.method, 500, app)
+
+    def metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics)
@@ -65,6 +65,71 @@ class AttendanceSchema(Schema):
     present = fields.Boolean()
     
 
+class CohortSchema(Schema):
+    dept = fields.Str(required = True)
+    batch = fields.Int(required = True)
+    sem = fields.Int(required = True)
+
+class BulkAttendanceSchema(Schema):
+    date = fields.Str(required = True)
+    records = fields.List(fields.Dict())
+    cohort = fields.Nested(CohortSchema)
+    present = fields.Boolean()
+    exceptions = fields.List(fields.Str())
+
+
+class AttendanceSummaryQuerySchema(Schema):
+    period = fields.Str(validate = validate.Regexp(r"^(\d{4}-\d{2}|sem-\d+)$"))
+    dept = fields.Str()
+    batch = fields.Int()
+    sem = fields.Int()
+
+
+class PaginationSchema(Schema):
+    limit = fields.Int(validate = validate.Range(min=1))
+    after = fields.Str()
+    stream = fields.Bool()
+
+
+class CohortFilterSchema(Schema):
+    dept = fields.Str()
+    batch = fields.Int()
+    sem = fields.Int(validate = validate.Range(min=1))
+
+class CohortUpdateSchema(Schema):
+    cohort = fields.Nested(CohortFilterSchema, required = True)
+    set = fields.Nested(CohortFilterSchema)
+    promote = fields.Boolean()
+    dry_run = fields.Boolean()
+
+
+class AttendanceExportQuerySchema(Schema):
+    dept = fields.Str()
+    batch = fields.Int()
+    sem = fields.Int()
+    start = fields.Date(format = "%d-%m-%Y", data_key = "from")
+    end = fields.Date(format = "%d-%m-%Y", data_key = "to")
+    columns = fields.Str(data_key = "fields")
+    format = fields.Str(validate = validate.OneOf(("csv", "parquet")))
+
+
+class AttendanceRangeQuerySchema(PaginationSchema):
+    start = fields.Date(required = True, format = "%d-%m-%Y", data_key = "from")
+    end = fields.Date(required = True, format = "%d-%m-%Y", data_key = "to")
+    student_id = fields.Str()
+    dept = fields.Str()
+    batch = fields.Int()
+    sem = fields.Int()
+
+
+class StudentQuerySchema(PaginationSchema):
+    dept = fields.Str()
+    batch = fields.Int()
+    sem = fields.Int()
+    name = fields.Str(validate = validate.Length(min=1))
+    columns = fields.Str(data_key = "fields")
+
+
 class BatchSchema(Schema):
     pass
 
@@ -0,0 +1,117 @@
+import contextlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from flask_smorest import abort
+from passlib.hash import pbkdf2_sha256
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _hash(password, rounds):
+    return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+
+def _verify(password, hashed):
+    return pbkdf2_sha256.verify(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Runs pbkdf2_sha256 hashing and verification off the request worker.
+
+    Work goes to a pool of `workers` processes (or threads, or inline when
+    workers is 0). At most `max_pending` calls may be queued or running at
+    once; beyond that callers get a 503 with Retry-After instead of piling up
+    behind a login storm and stalling every other endpoint.
+    """
+
+    def __init__(self, workers=2, max_pending=32, rounds=29000, executor="process", retry_after=1):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.configure(workers, max_pending, rounds, executor, retry_after)
+
+    def configure(self, workers=None, max_pending=None, rounds=None, executor=None, retry_after=None):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if workers is not None:
+                self.workers = workers
+            if max_pending is not None:
+                self.max_pending = max_pending
+                self._slots = threading.BoundedSemaphore(max_pending)
+            if rounds is not None:
+                self.rounds = rounds
+            if executor is not None:
+                self.executor = executor
+            if retry_after is not None:
+                self.retry_after = retry_after
+
+    def _pool(self):
+        # Created on first use so that pre-forking servers start the pool in
+        # each worker rather than sharing one across a fork.
+        with self._lock:
+            if self._executor is None:
+                pool_class = ThreadPoolExecutor if self.executor == "thread" else ProcessPoolExecutor
+                self._executor = pool_class(max_workers=self.workers)
+            return self._executor
+
+    @contextlib.contextmanager
+    def _slot(self):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            logger.warning("Password hashing queue is full, rejecting request.")
+            abort(
+                503,
+                message="The server is busy, please retry shortly.",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        try:
+            yield
+        finally:
+            slots.release()
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        with self._slot():
+            return self._pool().submit(fn, *args).result()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def hash_many(self, passwords):
+        """
+        Hash a batch of passwords in parallel across the pool.
+
+        The batch takes a single pending slot, and callers should keep batches
+        small (bulk imports hash one chunk at a time) so logins queued behind
+        it are not held up for long.
+        """
+        if self.workers <= 0:
+            return [_hash(password, self.rounds) for password in passwords]
+        with self._slot():
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            return list(self._pool().map(_hash, passwords, [self.rounds] * len(passwords), chunksize=chunksize))
+
+    def verify(self, password, hashed):
+        return self._run(_verify, password, hashed)
+
+    def needs_update(self, hashed):
+        """
+        True when `hashed` was made with fewer rounds than currently configured.
+        """
+        try:
+            return pbkdf2_sha256.from_string(hashed).rounds < self.rounds
+        except ValueError:
+            return False
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+PASSWORD_HASHER = PasswordHasher()
@@ -0,0 +1,126 @@
+import datetime
+import uuid
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from flask_smorest import abort
+from blocklist import BLOCKLIST
+from db import mongo
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
+
+REFRESH_COLLECTION = "refresh_tokens"
+
+# Refresh tokens are rotated: every /refresh spends the presented token and
+# returns a new one from the same family. Each issued token is recorded in
+# `refresh_tokens`:
+#
+#   {"_id": jti, "family", "identity", "issued_at", "expires_at",
+#    "used_at", "access_jti", "revoked"}
+#
+# Presenting a token that was already spent means it leaked (or the client
+# replayed it), so the whole family is revoked along with the access tokens it
+# issued, and the user has to log in again. A TTL index on `expires_at` drops
+# records once the token could not be used anyway.
+#
+# Logging out revokes the family of the access token's login as well. Without
+# rotation nothing is recorded, so access tokens carry the `refresh_jti` of
+# their refresh token instead and logout blocklists it.
+
+
+def _collection():
+    return mongo.db[REFRESH_COLLECTION]
+
+
+def _expiry(claims):
+    return datetime.datetime.utcfromtimestamp(claims["exp"]) if "exp" in claims else None
+
+
+def issue_tokens(identity, fresh=False, family=None):
+    """
+    Create an access token and a refresh token for `identity`, recording the
+    refresh token in its `family` (a new one on login) when rotation is on.
+
+    Returns:
+        A tuple (access_token, refresh_token).
+    """
+    if not current_app.config["REFRESH_TOKEN_ROTATION"]:
+        refresh_token = create_refresh_token(identity=identity)
+        refresh_jti = decode_token(refresh_token)["jti"]
+        access_token = create_access_token(
+            identity=identity, fresh=fresh, additional_claims={"refresh_jti": refresh_jti}
+        )
+        return access_token, refresh_token
+    access_token = create_access_token(identity=identity, fresh=fresh)
+    family = family or uuid.uuid4().hex
+    refresh_token = create_refresh_token(identity=identity, additional_claims={"family": family})
+    claims = decode_token(refresh_token)
+    _collection().insert_one({
+        "_id": claims["jti"],
+        "family": family,
+        "identity": identity,
+        "issued_at": datetime.datetime.utcnow(),
+        "expires_at": _expiry(claims),
+        "used_at": None,
+        "access_jti": decode_token(access_token)["jti"],
+    })
+    return access_token, refresh_token
+
+
+def revoke_family(family):
+    """
+    Revoke every refresh token of `family` and block the access tokens they issued.
+    """
+    collection = _collection()
+    collection.update_many({"family": family}, {"$set": {"revoked": True}})
+    for record in collection.find({"family": family, "access_jti": {"$ne": None}}, {"access_jti": 1}):
+        BLOCKLIST.add(record["access_jti"])
+
+
+def revoke_session(claims):
+    """
+    Revoke the refresh token(s) of the login that issued the access token
+    described by `claims`, so /refresh cannot outlive a logout.
+    """
+    if "refresh_jti" in claims:
+        lifetime = current_app.config["JWT_REFRESH_TOKEN_EXPIRES"]
+        expires_at = datetime.datetime.utcnow() + lifetime if lifetime else datetime.datetime.max
+        BLOCKLIST.add(claims["refresh_jti"], expires_at)
+        return
+    record = _collection().find_one({"access_jti": claims["jti"]}, {"family": 1})
+    if record is not None:
+        revoke_family(record["family"])
+
+
+def rotate(claims):
+    """
+    Spend the refresh token described by `claims` and issue its replacement.
+
+    Aborts with 401 when the token is unknown, revoked or already spent; in
+    the last case the whole family is revoked.
+
+    Returns:
+        A tuple (access_token, refresh_token).
+    """
+    identity = claims[current_app.config["JWT_IDENTITY_CLAIM"]]
+    if not current_app.config["REFRESH_TOKEN_ROTATION"]:
+        access_token = create_access_token(
+            identity=identity, fresh=False, additional_claims={"refresh_jti": claims["jti"]}
+        )
+        return access_token, None
+
+    now = datetime.datetime.utcnow()
+    spent = _collection().find_one_and_update(
+        {"_id": claims["jti"], "used_at": None, "revoked": {"$ne": True}},
+        {"$set": {"used_at": now}},
+        projection={"family": 1},
+    )
+    if spent is None:
+        record = _collection().find_one({"_id": claims["jti"]}, {"family": 1, "used_at": 1})
+        if record is not None and record.get("used_at") is not None:
+            logger.warning("Refresh token reuse for %s, revoking family %s.", identity, record["family"])
+            revoke_family(record["family"])
+        abort(401, message="The refresh token is no longer valid, please log in again.")
+
+    access_token, refresh_token = issue_tokens(identity, family=spent["family"])
+    return access_token, refresh_token
@@ -0,0 +1,232 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, current_app, request
+
+# Rough per-entry bookkeeping cost counted against the memory budget.
+ENTRY_OVERHEAD = 200
+
+
+class MemoryBackend:
+    """
+    In-process LRU store bounded by the total size of the cached bodies.
+    Every worker process has its own copy, so only use it with one worker.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._generations = defaultdict(int)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, body, expires):
+        size = len(key) + len(body) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, body)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, body = self._entries.pop(key)
+        self._size -= len(key) + len(body) + ENTRY_OVERHEAD
+
+    def generation(self, name):
+        return self._generations[name]
+
+    def bump(self, name):
+        with self._lock:
+            self._generations[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size}
+
+
+class SqliteBackend:
+    """
+    LRU store in a local SQLite file shared by every worker process on the
+    host, so a write handled by one worker invalidates the others' entries.
+
+    Each process opens one connection, sets up the schema once, and
+    serializes its threads (or greenlets) on a lock around it.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, body BLOB, size INTEGER, expires REAL, used REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        connection.execute("CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER)")
+        return connection
+
+    @contextmanager
+    def _connection(self):
+        if self._pid != os.getpid():
+            # First use in this process: the parent's connection and lock are
+            # not usable after a fork.
+            self._lock = threading.Lock()
+            self._db, self._pid = self._connect(), os.getpid()
+        with self._lock:
+            yield self._db
+
+    def get(self, key, now):
+        with self._connection() as connection:
+            row = connection.execute("SELECT body, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            connection.execute("UPDATE entries SET used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key, body, expires):
+        size = len(key) + len(body) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, body, size, expires, used) VALUES (?, ?, ?, ?, ?)",
+                (key, body, size, expires, time.time()),
+            )
+            excess = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0] - self.max_bytes
+            if excess > 0:
+                victims = []
+                for victim, victim_size in connection.execute("SELECT key, size FROM entries ORDER BY used"):
+                    victims.append((victim,))
+                    excess -= victim_size
+                    if excess <= 0:
+                        break
+                connection.executemany("DELETE FROM entries WHERE key = ?", victims)
+
+    def generation(self, name):
+        with self._connection() as connection:
+            row = connection.execute("SELECT value FROM generations WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, name):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO generations (name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,),
+            )
+
+    def stats(self):
+        with self._connection() as connection:
+            entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": entries, "bytes": size}
+
+
+def build_backend(name, max_bytes, path=None):
+    """
+    The backend configured by RESPONSE_CACHE_BACKEND: "memory", "shared" or "none".
+    """
+    if name == "memory":
+        return MemoryBackend(max_bytes)
+    if name == "shared":
+        return SqliteBackend(path or "response_cache.sqlite3", max_bytes)
+    return None
+
+
+class ResponseCache:
+    """
+    Caches the JSON responses of read endpoints.
+
+    Entries are keyed on the request path, query string and response format
+    plus the current generation of every collection the endpoint reads. Write
+    paths call bump() for the collections they change, which moves readers to
+    new keys; the old entries are never served again and age out of the LRU.
+    Entries also expire after `ttl` seconds to bound staleness from writes
+    made outside the API (CLI migrations, direct database edits).
+    """
+
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, backend=None, ttl=None):
+        self.backend = backend
+        if ttl is not None:
+            self.ttl = ttl
+
+    def bump(self, *collections):
+        if self.backend is not None:
+            for name in collections:
+                self.backend.bump(name)
+
+    def _key(self, collections):
+        generations = ",".join(f"{name}:{self.backend.generation(name)}" for name in collections)
+        fmt = request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"])
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+        return f"{request.path}?{query}|{fmt}|{generations}"
+
+    def cached(self, *collections):
+        """
+        Cache the decorated view's JSON result until one of `collections` is
+        written to. Streamed responses pass through uncached.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if self.backend is None or self.ttl <= 0:
+                    return fn(*args, **kwargs)
+                # Generations are read before the view runs, so a write racing
+                # with it files the result under a key that is already stale.
+                key = self._key(collections)
+                now = time.time()
+                body = self.backend.get(key, now)
+                if body is not None:
+                    self.hits += 1
+                    return Response(body, mimetype="application/json", headers={"X-Cache": "HIT"})
+                self.misses += 1
+                result = fn(*args, **kwargs)
+                if not isinstance(result, (dict, list)):
+                    return result
+                response = current_app.json.response(result)
+                self.backend.set(key, response.get_data(), now + self.ttl)
+                response.headers["X-Cache"] = "MISS"
+                return response
+            return wrapper
+        return decorator
+
+    def stats(self):
+        stats = self.backend.stats() if self.backend is not None else {"entries": 0, "bytes": 0}
+        return {"hits": self.hits, "misses": self.misses, **stats}
+
+
+RESPONSE_CACHE = ResponseCache()
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Generation counter of the shared store that broadcasts invalidations.
+GENERATION = "staff_roles"
+
+
+class RoleCache:
+    """
+    Bounded in-process cache of staff_id -> {"is_staff", "is_admin"}.
+
+    Entries expire `ttl` seconds after they were stored and the least recently
+    used entry is evicted once `maxsize` is reached. Writes to a staff record
+    must call invalidate() so role changes apply before the entry expires.
+
+    Every worker process has its own entries. With a `shared` store (a
+    response cache backend, whose generation counters every worker reads)
+    invalidate() also bumps the "staff_roles" generation, and each worker
+    drops all its entries at its next lookup after seeing it change. Without
+    one, other workers keep serving a changed role for up to `ttl` seconds.
+    """
+
+    def __init__(self, ttl=60, maxsize=10000, shared=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def configure(self, ttl=None, maxsize=None, shared=None):
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if shared is not None:
+                self.shared = shared
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _sync(self):
+        # Read before the caller's database lookup, so a role stored after a
+        # concurrent change is dropped at the next get() at the latest.
+        generation = self.shared.generation(GENERATION)
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+
+    def get(self, staff_id):
+        if self.shared is not None:
+            self._sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(staff_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[staff_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(staff_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, staff_id, role):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[staff_id] = (time.monotonic() + self.ttl, role)
+            self._entries.move_to_end(staff_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, staff_id=None):
+        """
+        Drop the entry for `staff_id`, or every entry when no id is given.
+        """
+        with self._lock:
+            if staff_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(staff_id), None)
+        if self.shared is not None:
+            self.shared.bump(GENERATION)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+ROLE_CACHE = RoleCache()
@@ -1,16 +1,29 @@
 import datetime
 from email import message
-import json
 from os import access
-from bson import ObjectId, json_util
+from bson import ObjectId
+from flask import Response, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
-from helper import authorize
-from models.schema import AttendanceSchema
+from marshmallow import ValidationError
+from helper import authorize, ndjson_response, wants_stream
+from werkzeug.exceptions import HTTPException
+from models.schema import (
+    AttendanceExportQuerySchema, AttendanceRangeQuerySchema, AttendanceSchema, AttendanceSummaryQuerySchema,
+    BulkAttendanceSchema, PaginationSchema,
+)
+import attendance_export
+from attendance_buffer import ATTENDANCE_BUFFER, DURABILITY_ENQUEUE
+import attendance_summary
+from attendance_store import get_attendance_store, normalize_date
 from db import mongo
+from response_cache import RESPONSE_CACHE
+from serializer import to_json
 import re
-from log_services.logger import logger  # Import your logger
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
 
 blp = Blueprint("attendance", __name__, description="Operations on attendance")
 
@@ -26,18 +39,27 @@ class Attendance(MethodView):
     
     @jwt_required()
     @authorize(permission="staff")
-    def get(self):
+    @blp.arguments(PaginationSchema, location="query")
+    @RESPONSE_CACHE.cached("attendance")
+    def get(self, page_args):
         """
-        Retrieve all attendance records from the database.
-        
+        Retrieve one page of attendance records, ordered by (date, _id).
+
+        Args:
+            page_args (dict): `limit` and the opaque `after` cursor of the previous page.
+
         Returns:
-            A JSON object containing a list of all attendance records.
+            A JSON object containing a page of attendance records and the `next_cursor`,
+            or an NDJSON stream of every record when `stream` is requested.
         """
-        logger.info("Fetching all attendance records.")
-        attendance_list = mongo.db.attendance.find()
-        attendance_list = json.loads(json_util.dumps(attendance_list))
+        logger.info("Fetching a page of attendance records.")
+        store = get_attendance_store()
+        if wants_stream(page_args):
+            return ndjson_response(store.stream(page_args))
+        attendance_list, next_cursor = store.page(page_args)
+        attendance_list = to_json(attendance_list)
         logger.info("Attendance records retrieved successfully.")
-        return {"attendance": list(attendance_list)}
+        return {"attendance": list(attendance_list), "next_cursor": next_cursor}
     
     @jwt_required()
     @authorize(permission="admin")
@@ -46,26 +68,297 @@ class Attendance(MethodView):
         """
         Add a new attendance record to the database.
 
+        With the write-behind buffer enabled the record is queued and upserted
+        on (student_id, date) in a batch with other posts.
+
         Args:
             attendance_data (dict): The data for the new attendance record.
 
         Returns:
-            A JSON object with a success message.
+            A JSON object with a success message, with status 202 when the
+            buffer acknowledges records as soon as they are queued.
         
         Raises:
             400 Bad Request: If an exception occurs during the insertion.
+            503 Service Unavailable: If the write-behind buffer is full.
         """
         logger.info("Attempting to add new attendance data.")
         try:
-            attendance_data['date'] = datetime.datetime.strptime(attendance_data['date'], f"%d-%m-%Y")
-            print(attendance_data['date'])
-            mongo.db.attendance.insert_one(attendance_data)
+            attendance_data['date'] = normalize_date(attendance_data['date'])
+            if ATTENDANCE_BUFFER.enabled:
+                if not attendance_data.get("student_id"):
+                    abort(400, message="student_id is required.")
+                ATTENDANCE_BUFFER.submit(attendance_data)
+                if ATTENDANCE_BUFFER.durability == DURABILITY_ENQUEUE:
+                    return {"message": "Attendance data queued for writing"}, 202
+                return {"message": "Attendance data updated successfully"}
+            changes = get_attendance_store().insert(attendance_data)
+            attendance_summary.apply_changes(mongo.db, changes)
+            RESPONSE_CACHE.bump("attendance")
             logger.info("Attendance data updated successfully.")
             return {"message": "Attendance data updated successfully"}
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"An error occurred while inserting attendance data: {e}")
+            logger.error("An error occurred while inserting attendance data: %s", e)
             abort(400, message=f"An exception occurred while inserting data, {e}")
 
+def roll_call_rows(roll_call):
+    """
+    Expand a roll call into one {"student_id", "present"} row per student.
+
+    A cohort marks every student of (dept, batch, sem) with `present` (default
+    True), except the ids listed in `exceptions`, which get the opposite value.
+    Explicit `records` are applied last and override the cohort rows.
+    """
+    rows = {}
+    if "cohort" in roll_call:
+        default = roll_call.get("present", True)
+        exceptions = set(roll_call.get("exceptions", []))
+        for student in mongo.db.students.find(roll_call["cohort"], {"_id": 1}):
+            student_id = str(student["_id"])
+            rows[student_id] = {"student_id": student_id, "present": default != (student_id in exceptions)}
+    for record in roll_call.get("records", []):
+        rows[record.get("student_id")] = record
+    return list(rows.values())
+
+
+@blp.route("/attendance/bulk")
+class AttendanceBulk(MethodView):
+    """
+    A resource class for marking the attendance of many students in one request.
+
+    Methods:
+        post: Upserts a whole roll call for a date.
+    """
+
+    @jwt_required()
+    @authorize(permission="admin")
+    @blp.arguments(BulkAttendanceSchema)
+    def post(self, roll_call):
+        """
+        Mark attendance for a list of students or a whole cohort on one date.
+
+        Args:
+            roll_call (dict): The `date` plus `records` of (student_id, present)
+                and/or a `cohort` with a default `present` and `exceptions`.
+
+        Returns:
+            A JSON object with per-row results and created/updated/invalid/error totals.
+
+        Raises:
+            400 Bad Request: If the date is invalid or no students were given.
+        """
+        if "records" not in roll_call and "cohort" not in roll_call:
+            abort(400, message="Either records or a cohort is required.")
+        try:
+            date = normalize_date(roll_call["date"])
+        except ValueError as e:
+            abort(400, message=f"Invalid date, {e}")
+
+        rows = roll_call_rows(roll_call)
+        logger.info("Marking bulk attendance of %s students for %s.", len(rows), date)
+        try:
+            loaded, errors = AttendanceSchema(many=True).load(rows), {}
+        except ValidationError as e:
+            loaded, errors = e.valid_data, e.messages
+        results, valid = [], []
+        for index, row in enumerate(loaded):
+            row_errors = dict(errors.get(index, {}))
+            for field in ("student_id", "present"):
+                if field not in row and field not in row_errors:
+                    row_errors[field] = ["Missing data for required field."]
+            if row_errors:
+                results.append({"student_id": rows[index].get("student_id"), "status": "invalid", "errors": row_errors})
+            else:
+                valid.append({"student_id": row["student_id"], "present": row["present"]})
+        written, changes = get_attendance_store().upsert_many(date, valid)
+        attendance_summary.apply_changes(mongo.db, changes)
+        RESPONSE_CACHE.bump("attendance")
+        results.extend(written)
+
+        totals = {"created": 0, "updated": 0, "invalid": 0, "error": 0}
+        for entry in results:
+            totals[entry["status"]] += 1
+        logger.info("Bulk attendance for %s done: %s", date, totals)
+        return {"message": "Attendance data updated successfully", **totals, "results": results}
+
+
+@blp.route("/attendance/summary/student/<string:student_id>")
+class AttendanceSummaryStudent(MethodView):
+    """
+    A resource class for the pre-aggregated attendance of one student.
+
+    Methods:
+        get: Retrieves the student's monthly and semester attendance percentages.
+    """
+
+    @jwt_required()
+    @authorize(permission="staff")
+    @blp.arguments(AttendanceSummaryQuerySchema, location="query")
+    def get(self, query_args, student_id):
+        """
+        Retrieve the attendance summaries of a student.
+
+        Args:
+            query_args (dict): Optional `period` ("2024-01" or "sem-5") to return a single summary.
+            student_id (str): The ID of the student.
+
+        Returns:
+            A JSON object with present/total counters and the percentage for each period.
+        """
+        query = {"scope": "student", "student_id": student_id}
+        if "period" in query_args:
+            query["period"] = query_args["period"]
+        summaries = mongo.db.attendance_summary.find(query, {"_id": 0, "scope": 0}).sort("period", 1)
+        return {"student_id": student_id, "summary": [attendance_summary.with_percentage(s) for s in summaries]}
+
+
+@blp.route("/attendance/summary/cohort")
+class AttendanceSummaryCohort(MethodView):
+    """
+    A resource class for the pre-aggregated attendance of a (dept, batch, sem) cohort.
+
+    Methods:
+        get: Retrieves the cohort's attendance percentage for one period.
+    """
+
+    @jwt_required()
+    @authorize(permission="staff")
+    @blp.arguments(AttendanceSummaryQuerySchema, location="query")
+    def get(self, query_args):
+        """
+        Retrieve the attendance summary of a cohort for one period.
+
+        Args:
+            query_args (dict): `dept`, `batch`, `sem` and an optional `period`,
+                which defaults to the whole semester.
+
+        Returns:
+            A JSON object with the present/total counters and the percentage.
+
+        Raises:
+            400 Bad Request: If the cohort is not fully specified.
+        """
+        if not all(field in query_args for field in ("dept", "batch", "sem")):
+            abort(400, message="dept, batch and sem are required.")
+        period = query_args.get("period", f"sem-{query_args['sem']}")
+        key = attendance_summary.cohort_summary_id(query_args["dept"], query_args["batch"], query_args["sem"], period)
+        summary = mongo.db.attendance_summary.find_one({"_id": key}, {"_id": 0, "scope": 0})
+        if summary is None:
+            summary = {"dept": query_args["dept"], "batch": query_args["batch"], "sem": query_args["sem"],
+                       "period": period, "present": 0, "total": 0}
+        return attendance_summary.with_percentage(summary)
+
+
+def export_columns(value):
+    """
+    Parse a comma-separated `fields` list, defaulting to attendance_export.DEFAULT_FIELDS.
+    """
+    if not value:
+        return attendance_export.DEFAULT_FIELDS
+    columns = tuple(column.strip() for column in value.split(",") if column.strip())
+    unknown = [column for column in columns if column not in attendance_export.FIELDS]
+    if unknown or not columns:
+        abort(400, message=f"Unknown fields {unknown}, choose from {', '.join(attendance_export.FIELDS)}.")
+    return columns
+
+
+@blp.route("/attendance/export")
+class AttendanceExport(MethodView):
+    """
+    A resource class for bulk attendance exports.
+
+    Methods:
+        get: Streams attendance joined with the students' dept/batch/sem.
+    """
+
+    @jwt_required()
+    @authorize(permission="staff")
+    @blp.arguments(AttendanceExportQuerySchema, location="query")
+    def get(self, export_args):
+        """
+        Stream the attendance of a cohort over a date range as CSV or Parquet.
+
+        Args:
+            export_args (dict): Optional `dept`, `batch`, `sem` cohort filters,
+                `from`/`to` dates (DD-MM-YYYY, inclusive), a comma-separated
+                `fields` list and the `format` ("csv" or "parquet").
+
+        Returns:
+            A streamed CSV file, or a Parquet file written in row groups.
+
+        Raises:
+            400 Bad Request: If a field is unknown or Parquet support is not installed.
+        """
+        columns = export_columns(export_args.get("columns"))
+        fmt = export_args.get("format", "csv")
+        if fmt == "parquet":
+            try:
+                attendance_export.require_pyarrow()
+            except ImportError as e:
+                abort(400, message=str(e))
+        cohort = {field: export_args[field] for field in ("dept", "batch", "sem") if field in export_args}
+        start, end = (normalize_date(export_args[bound]) if bound in export_args else None for bound in ("start", "end"))
+        logger.info("Exporting attendance of %s from %s to %s as %s.", cohort, start, end, fmt)
+        rows = attendance_export.export_rows(
+            mongo.db, get_attendance_store(), cohort, start, end, columns, current_app.config["EXPORT_CHUNK_SIZE"]
+        )
+        chunks = attendance_export.encode(rows, columns, fmt, current_app.config["EXPORT_ROW_GROUP_SIZE"])
+        return Response(
+            chunks,
+            mimetype="text/csv" if fmt == "csv" else "application/vnd.apache.parquet",
+            headers={"Content-Disposition": f'attachment; filename="attendance.{fmt}"'},
+        )
+
+
+@blp.route("/attendance/range")
+class AttendanceRange(MethodView):
+    """
+    A resource class for attendance over a date range.
+
+    Methods:
+        get: Retrieves the attendance of a student or cohort between two dates.
+    """
+
+    @jwt_required()
+    @authorize(permission="staff")
+    @blp.arguments(AttendanceRangeQuerySchema, location="query")
+    @RESPONSE_CACHE.cached("attendance", "students")
+    def get(self, range_args):
+        """
+        Retrieve one page of the attendance records dated between two days.
+
+        Args:
+            range_args (dict): `from` and `to` dates (DD-MM-YYYY, inclusive), an
+                optional `student_id` and/or `dept`, `batch`, `sem` cohort
+                filters, plus `limit`, `after` and `stream` as for GET /attendance.
+
+        Returns:
+            A JSON object containing a page of attendance records and the `next_cursor`,
+            or an NDJSON stream of every matching record when `stream` is requested.
+
+        Raises:
+            400 Bad Request: If `to` is before `from`.
+        """
+        start, end = normalize_date(range_args["start"]), normalize_date(range_args["end"])
+        if end < start:
+            abort(400, message="The to date must not be before the from date.")
+        student_ids = None
+        cohort = {field: range_args[field] for field in ("dept", "batch", "sem") if field in range_args}
+        if cohort:
+            student_ids = [str(student["_id"]) for student in mongo.db.students.find(cohort, {"_id": 1})]
+        if "student_id" in range_args:
+            student_id = range_args["student_id"]
+            student_ids = [student_id] if student_ids is None or student_id in student_ids else []
+        logger.info("Fetching attendance from %s to %s for %s.", start, end, cohort or range_args.get("student_id", "all"))
+        store = get_attendance_store()
+        if wants_stream(range_args):
+            return ndjson_response(store.stream_range(range_args, start, end, student_ids))
+        attendance_list, next_cursor = store.page_range(range_args, start, end, student_ids)
+        return {"attendance": list(to_json(attendance_list)), "next_cursor": next_cursor}
+
+
 @blp.route("/attendance/<string:student_id>")
 class AttendanceStudent(MethodView):
     """
@@ -87,13 +380,13 @@ class AttendanceStudent(MethodView):
         Returns:
             A JSON object containing a list of attendance records for the student.
         """
-        logger.info(f"Fetching attendance records for student ID: {student_id}")
-        attendance_list = mongo.db.attendance.find({"student_id": student_id})
-        attendance_list = json.loads(json_util.dumps(attendance_list))
-        logger.info(f"Attendance records retrieved for student ID: {student_id}")
+        logger.info("Fetching attendance records for student ID: %s", student_id)
+        attendance_list = get_attendance_store().for_student(student_id)
+        attendance_list = to_json(attendance_list)
+        logger.info("Attendance records retrieved for student ID: %s", student_id)
         return {"attendance": list(attendance_list)}
     
-@blp.route("/attendance/<string:date>")
+@blp.route("/attendance/date/<string:date>")
 class AttendanceDate(MethodView):
     """
     A resource class for handling operations on attendance records by date.
@@ -104,23 +397,31 @@ class AttendanceDate(MethodView):
     
     @jwt_required()
     @authorize(permission="admin")
-    def get(self, date):
+    @blp.arguments(PaginationSchema, location="query")
+    @RESPONSE_CACHE.cached("attendance")
+    def get(self, page_args, date):
         """
-        Retrieve attendance records for a specific date.
+        Retrieve one page of the attendance records of a specific date.
 
         Args:
-            date (str): The date in the format 'YYYY-MM-DD'.
+            page_args (dict): `limit` and the opaque `after` cursor of the previous page.
+            date (str): The date in the format 'DD-MM-YYYY', as used when marking attendance.
 
         Returns:
-            A JSON object containing a list of attendance records for the date.
+            A JSON object containing a page of attendance records for the date
+            and the `next_cursor`, or an NDJSON stream when `stream` is requested.
+
+        Raises:
+            400 Bad Request: If the date is invalid.
         """
-        logger.info(f"Fetching attendance records for date: {date}")
+        logger.info("Fetching attendance records for date: %s", date)
         try:
-            date = datetime.datetime.strptime(date, f"%Y-%m-%d").datetime()
-            attendance_list = mongo.db.attendance.find({"date": date})
-            attendance_list = json.loads(json_util.dumps(attendance_list))
-            logger.info(f"Attendance records retrieved for date: {date}")
-            return {"attendance": list(attendance_list)}
-        except Exception as e:
-            logger.error(f"An error occurred while fetching attendance data for date {date}: {e}")
-            abort(400, message=f"An error occurred while fetching attendance data for date {date}. {e}")
+            date = normalize_date(date)
+        except ValueError as e:
+            abort(400, message=f"Invalid date {date}, expected DD-MM-YYYY. {e}")
+        store = get_attendance_store()
+        if wants_stream(page_args):
+            return ndjson_response(store.stream_range(page_args, date, date))
+        attendance_list, next_cursor = store.page_range(page_args, date, date)
+        logger.info("Attendance records retrieved for date: %s", date)
+        return {"attendance": list(to_json(attendance_list)), "next_cursor": next_cursor}
@@ -1,18 +1,26 @@
 import datetime
 from email import message
-import json
 from os import access
-from bson import ObjectId, json_util
+from bson import ObjectId
 from flask import request
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
-from helper import authorize
-from models.schema import StaffUpdateSchema, StaffSchema
-from passlib.hash import pbkdf2_sha256
+from werkzeug.exceptions import HTTPException
+from helper import (
+    authorize, etag_headers, if_match_filter, not_modified, paginate, stream_ndjson, update_document,
+    wants_stream,
+)
+from models.schema import StaffUpdateSchema, StaffSchema, PaginationSchema
 from db import mongo
+from passwords import PASSWORD_HASHER
+from role_cache import ROLE_CACHE
+from response_cache import RESPONSE_CACHE
+from serializer import to_json
 import re
-from log_services.logger import logger  # Import your logger
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
 
 blp = Blueprint("staff", __name__, description="Operations on staff")
 
@@ -30,50 +38,70 @@ class Staff(MethodView):
     @authorize(permission= "staff")
     @blp.response(200,StaffSchema)
     def get(self,staff_id):
+        unchanged = not_modified(mongo.db.staff, {"_id": ObjectId(staff_id)})
+        if unchanged is not None:
+            return unchanged
         staff = mongo.db.staff.find_one_or_404({"_id":ObjectId(staff_id)})
-        staff = json.loads(json_util.dumps(staff))
-        return {**staff}
+        headers = etag_headers(staff)
+        staff = to_json(staff)
+        return {**staff}, 200, headers
     
     @jwt_required()
     @authorize(permission= "admin")
     @blp.response(200, StaffSchema)
     @blp.arguments(StaffUpdateSchema)
     def put(self,staff_data,staff_id):
+        if 'password' in staff_data:
+            staff_data['password']= PASSWORD_HASHER.hash(staff_data['password'])
         try:
-            staff_data['password']= pbkdf2_sha256.hash(staff_data['password'])
-        except:
-            pass
-        finally:
-            try:
-                staff_data['updated_at']= datetime.datetime.now()
-                mongo.db.staff.update_one({"_id": ObjectId(staff_id)}, {'$set': staff_data})
-                staff = mongo.db.staff.find_one_or_404({"_id": ObjectId(staff_id)})
-                staff = json.loads(json_util.dumps(staff))
-                return {"message": "Member updated successfully ", **staff}
-            except Exception as e:
-                abort(401, message= f"An error occurred while updating. {e}")
+            staff_data['updated_at']= datetime.datetime.now()
+            query = if_match_filter(mongo.db.staff, {"_id": ObjectId(staff_id)})
+            staff = update_document(mongo.db.staff, query, {'$set': staff_data, '$inc': {'version': 1}})
+            RESPONSE_CACHE.bump("staff")
+            ROLE_CACHE.invalidate(staff_id)
+            headers = etag_headers(staff)
+            staff = to_json(staff)
+            return {"message": "Member updated successfully ", **staff}, 200, headers
+        except HTTPException:
+            raise
+        except Exception as e:
+            abort(401, message= f"An error occurred while updating. {e}")
 
     @jwt_required()
     @authorize(permission= "admin")
     def delete(self, staff_id):
         try:
             mongo.db.staff.delete_one({"_id":ObjectId(staff_id)})
+            RESPONSE_CACHE.bump("staff")
+            ROLE_CACHE.invalidate(staff_id)
             return {"message": "Staff deleted"}
         except Exception as e:
             abort(401, message= f"An error occurred while updating. {e}")
 
 
 
+@blp.route("/staff/role-cache")
+class StaffRoleCache(MethodView):
+    @jwt_required()
+    @authorize(permission= "admin")
+    def get(self):
+        return ROLE_CACHE.stats()
+
+
 @blp.route("/staff")
 class StaffList(MethodView):
     @jwt_required()
     @authorize(permission= "admin")
-    def get(self):
+    @blp.arguments(PaginationSchema, location="query")
+    @RESPONSE_CACHE.cached("staff")
+    def get(self, page_args):
         # logger.info("GET method accessed for all staffs")
-        staff_list = mongo.db.staff.find()
-        staff_list = json.loads(json_util.dumps(staff_list))
+        if wants_stream(page_args):
+            return stream_ndjson(mongo.db.staff, page_args)
+        staff_list, next_cursor = paginate(mongo.db.staff, page_args)
+        staff_list = to_json(staff_list)
         # logger.info("All staffs retrieved successfully")
-        return {"staff_list": list(staff_list)}
+        return {"staff_list": list(staff_list), "next_cursor": next_cursor}
     
 
 
@@ -1,58 +1,102 @@
 import datetime
-import json
 from os import access
-from bson import ObjectId, json_util
+from bson import ObjectId
+from bson.errors import InvalidId
 from flask import request
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
-from models.schema import  StudentSchema,StudentUpdateSchema
-from passlib.hash import pbkdf2_sha256
+from models.schema import  StudentSchema,StudentUpdateSchema,StudentQuerySchema,CohortUpdateSchema
+import attendance_summary
+from attendance_store import get_attendance_store
 from db import mongo
-from helper import authorize
+from passwords import PASSWORD_HASHER
+from response_cache import RESPONSE_CACHE
+from serializer import to_json
+from werkzeug.exceptions import HTTPException
+from helper import (
+    authorize, etag_headers, if_match_filter, not_modified, paginate, stream_ndjson, update_document,
+    wants_stream,
+)
 import re
-from log_services.logger import logger  # Import your logger
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 
 blp = Blueprint("student", __name__, description="Operations on students")
 
+# Fields a client may ask for with `fields=`; the password hash is never returned.
+STUDENT_FIELDS = ("_id", "email", "name", "phone", "dept", "batch", "sem", "created_at", "updated_at")
+
+
+def student_filter(args):
+    """
+    Translate the StudentQuerySchema filters into a MongoDB query.
+
+    dept/batch/sem are equality matches served by the dept_batch_sem_id index and
+    `name` is an anchored, case-sensitive prefix that can use the name_id index.
+    """
+    query = {field: args[field] for field in ("dept", "batch", "sem") if field in args}
+    if args.get("name"):
+        query["name"] = {"$regex": f"^{re.escape(args['name'])}"}
+    return query
+
+
+def student_projection(columns):
+    """
+    The projection for a comma-separated `fields` list, excluding password either way.
+    """
+    if not columns:
+        return {"password": 0}
+    fields = [field.strip() for field in columns.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in STUDENT_FIELDS]
+    if unknown or not fields:
+        abort(400, message=f"Unknown fields {unknown}, choose from {', '.join(STUDENT_FIELDS)}.")
+    # _id is always kept because the pagination cursor is built from it.
+    return {field: 1 for field in fields}
+
 
 @blp.route("/student/<string:student_id>")
 class Student(MethodView):
     @jwt_required()
     @blp.response(200,StudentSchema)
     def get(self,student_id):
+        unchanged = not_modified(mongo.db.students, {"_id": ObjectId(student_id)})
+        if unchanged is not None:
+            return unchanged
         student = mongo.db.students.find_one_or_404({"_id":ObjectId(student_id)})
-        student = json.loads(json_util.dumps(student))
-        return {**student}
+        headers = etag_headers(student)
+        student = to_json(student)
+        return {**student}, 200, headers
     
     @jwt_required()
     @authorize(permission= "staff")
     @blp.response(200, StudentSchema)
     @blp.arguments(StudentUpdateSchema)
     def put(self,student_data,student_id):
+        if 'password' in student_data:
+            student_data['password']= PASSWORD_HASHER.hash(student_data['password'])
         try:
-            student_data['password']= pbkdf2_sha256.hash(student_data['password'])
-
-        except:
-            pass
-
-        finally:
-            try:
-                student_data['updated_at']= datetime.datetime.now()
-                mongo.db.students.update_one({"_id": ObjectId(student_id)}, {'$set': student_data})
-                student = mongo.db.students.find_one_or_404({"_id": ObjectId(student_id)})
-                student = json.loads(json_util.dumps(student))
-                return {"message": "Student updated successfully ", **student}
-            except Exception as e:
-                abort(401, message= f"An error occurred while updating. {e}")
+            student_data['updated_at']= datetime.datetime.now()
+            query = if_match_filter(mongo.db.students, {"_id": ObjectId(student_id)})
+            student = update_document(mongo.db.students, query, {'$set': student_data, '$inc': {'version': 1}})
+            RESPONSE_CACHE.bump("students")
+            headers = etag_headers(student)
+            student = to_json(student)
+            return {"message": "Student updated successfully ", **student}, 200, headers
+        except HTTPException:
+            raise
+        except Exception as e:
+            abort(401, message= f"An error occurred while updating. {e}")
 
     @jwt_required()
     @authorize(permission= "staff")
     def delete(self, student_id):
         try:
             mongo.db.students.delete_one({"_id":ObjectId(student_id)})
+            RESPONSE_CACHE.bump("students")
             return {"message": "student deleted"}
         except Exception as e:
             abort(401, message= f"An error occurred while updating. {e}")
@@ -62,13 +106,116 @@ class Student(MethodView):
 @blp.route("/student")
 class StudentList(MethodView):
     @jwt_required()
-    def get(self):
+    @blp.arguments(StudentQuerySchema, location="query")
+    @RESPONSE_CACHE.cached("students")
+    def get(self, page_args):
         # logger.info("GET method accessed for all students")
-        student_list = mongo.db.students.find()
-        student_list = json.loads(json_util.dumps(student_list))
+        query = student_filter(page_args)
+        projection = student_projection(page_args.get("columns"))
+        if wants_stream(page_args):
+            return stream_ndjson(mongo.db.students, page_args, query, projection=projection)
+        student_list, next_cursor = paginate(mongo.db.students, page_args, query, projection=projection)
+        student_list = to_json(student_list)
         # logger.info("All students retrieved successfully")
-        return {"student_list": list(student_list)}
-    
+        return {"student_list": list(student_list), "next_cursor": next_cursor}
+
+
+def dashboard_pipeline(student_id, store):
+    """
+    One aggregation returning a student's attendance counted per month, one
+    document per month in order, each carrying the profile in `student`.
+
+    The attendance is joined on student_id (served by the student_id_date or
+    student_id_month index), unwound and grouped by month.
+    """
+    return [
+        {"$match": {"_id": student_id}},
+        {"$project": {"password": 0}},
+        {"$addFields": {"student_key": {"$toString": "$_id"}}},
+        {"$lookup": {
+            "from": store.collection.name,
+            "localField": "student_key",
+            "foreignField": "student_id",
+            "as": "attendance",
+        }},
+        {"$unwind": {"path": "$attendance", "preserveNullAndEmptyArrays": True}},
+        {"$group": {**store.monthly_group("attendance"), "student": {"$first": "$$ROOT"}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+@blp.route("/student/<string:student_id>/dashboard")
+class StudentDashboard(MethodView):
+    @jwt_required()
+    @authorize(permission= "self_or_staff")
+    @RESPONSE_CACHE.cached("students", "attendance")
+    def get(self, student_id):
+        """
+        The student's profile with monthly and overall attendance percentages,
+        for the student themselves or any staff member, in one round trip.
+        """
+        try:
+            object_id = ObjectId(student_id)
+        except InvalidId:
+            abort(404, message="Student not found.")
+        rows = list(mongo.db.students.aggregate(dashboard_pipeline(object_id, get_attendance_store())))
+        if not rows:
+            abort(404, message="Student not found.")
+        student = rows[0]["student"]
+        student.pop("attendance", None)
+        student.pop("student_key", None)
+        months = [
+            attendance_summary.with_percentage({"month": row["_id"], "present": row["present"], "total": row["total"]})
+            for row in rows if row["_id"] is not None
+        ]
+        overall = attendance_summary.with_percentage({
+            "present": sum(month["present"] for month in months),
+            "total": sum(month["total"] for month in months),
+        })
+        return {"student": to_json(student), "attendance": {"overall": overall, "months": months}}
+
+
+@blp.route("/student/cohort")
+class StudentCohort(MethodView):
+    @jwt_required()
+    @authorize(permission= "admin")
+    @blp.arguments(CohortUpdateSchema)
+    def put(self, cohort_update):
+        """
+        Update every student of a cohort with one update_many.
+
+        Args:
+            cohort_update (dict): `cohort`, any of dept/batch/sem to match;
+                `set`, new dept/batch/sem values; `promote` to move the cohort
+                to the next semester; `dry_run` to only count the matches.
+
+        Returns:
+            A JSON object with the matched and modified totals.
 
+        Raises:
+            400 Bad Request: If the cohort or the update is empty, or both
+                `promote` and a new `sem` are given.
+        """
+        cohort = cohort_update["cohort"]
+        changes = cohort_update.get("set", {})
+        promote = cohort_update.get("promote", False)
+        if not cohort:
+            abort(400, message="The cohort needs at least one of dept, batch or sem.")
+        if not changes and not promote:
+            abort(400, message="Nothing to update, give set and/or promote.")
+        if promote and "sem" in changes:
+            abort(400, message="Use either promote or a new sem, not both.")
 
+        if cohort_update.get("dry_run"):
+            matched = mongo.db.students.count_documents(cohort)
+            return {"dry_run": True, "matched": matched, "modified": 0}
 
+        update = {
+            "$set": {**changes, "updated_at": datetime.datetime.now()},
+            "$inc": {"version": 1, **({"sem": 1} if promote else {})},
+        }
+        result = mongo.db.students.update_many(cohort, update)
+        RESPONSE_CACHE.bump("students")
+        logger.info("Updated cohort %s with %s: %s matched, %s modified.",
+                    cohort, update, result.matched_count, result.modified_count)
+        return {"dry_run": False, "matched": result.matched_count, "modified": result.modified_count}
@@ -1,45 +1,62 @@
 import datetime
-import json
 from os import access
-from bson import ObjectId, json_util
-from flask import request
+from bson import ObjectId
+from flask import current_app, request
 from flask_jwt_extended import (
-    create_access_token,
-    create_refresh_token,
     jwt_required,
     get_jwt,
 )
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
+from werkzeug.exceptions import HTTPException
 import jwt
 from helper import authorize
+from refresh_tokens import issue_tokens, revoke_session, rotate
+from bulk_import import FORMATS, detect_format, import_members, read_rows
 from models.schema import PlainStudentSchema, LoginSchema, PlainStaffSchema
-from passlib.hash import pbkdf2_sha256
 from blocklist import BLOCKLIST
 from db import mongo
+from passwords import PASSWORD_HASHER
+from response_cache import RESPONSE_CACHE
+from role_cache import ROLE_CACHE
+from serializer import to_json
 import re
-from log_services.logger import logger  # Import your logger
+from log_services.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 
 blp = Blueprint("login", __name__, description="Login/logout operations")
 
 
+def upgrade_password_hash(collection, member, password):
+    """
+    Re-hash a just-verified password when its stored hash uses fewer rounds than configured.
+    """
+    if PASSWORD_HASHER.needs_update(member["password"]):
+        collection.update_one(
+            {"_id": member["_id"], "password": member["password"]},
+            {"$set": {"password": PASSWORD_HASHER.hash(password)}},
+        )
+        RESPONSE_CACHE.bump(collection.name)
+        logger.info("Upgraded the password hash of %s", member['_id'])
+
+
 @blp.route("/login")
 class Login(MethodView):
     @blp.arguments(LoginSchema)
     def post(self, login_data):
         if re.match(".*@.*staff.*", login_data["email"]):
             try:
-                print("enter try block")
                 staff = mongo.db.staff.find_one({"email": login_data["email"]})
-                if staff and pbkdf2_sha256.verify(
+                if staff and PASSWORD_HASHER.verify(
                     login_data["password"], staff["password"]
                 ):
-                    print("logged in")
+                    logger.debug("Staff %s logged in.", staff["_id"])
+                    upgrade_password_hash(mongo.db.staff, staff, login_data["password"])
                     staff_id = str(staff["_id"])
-                    access_token = create_access_token(identity=staff_id, fresh=True)
-                    refresh_token = create_refresh_token(identity=staff_id)
+                    access_token, refresh_token = issue_tokens(staff_id, fresh=True)
                     return {
                         "message": "Staff logged in successfully",
                         "access_token": access_token,
@@ -47,17 +64,19 @@ class Login(MethodView):
                     }, 200
                 else:
                     abort(401, message="Invalid credentials")
+            except HTTPException:
+                raise
             except Exception as e:
                 abort(500, message=f"An error occurred during login: {e}")
         elif re.match(".*@.*student.*", login_data["email"]):
             try:
                 student = mongo.db.students.find_one({"email": login_data["email"]})
-                if student and pbkdf2_sha256.verify(
+                if student and PASSWORD_HASHER.verify(
                     login_data["password"], student["password"]
                 ):
+                    upgrade_password_hash(mongo.db.students, student, login_data["password"])
                     student_id = str(student["_id"])
-                    access_token = create_access_token(identity=student_id, fresh=True)
-                    refresh_token = create_refresh_token(identity=student_id)
+                    access_token, refresh_token = issue_tokens(student_id, fresh=True)
                     return {
                         "message": "Student logged in successfully",
                         "access_token": access_token,
@@ -65,19 +84,38 @@ class Login(MethodView):
                     }, 200
                 else:
                     abort(401, message="Invalid credentials")
+            except HTTPException:
+                raise
             except Exception as e:
                 abort(500, message=f"An error occurred during login {e}")
         return {"message": "Invalid email"}
 
 
+@blp.route("/refresh")
+class TokenRefresh(MethodView):
+    @jwt_required(refresh=True)
+    def post(self):
+        """
+        Exchange a refresh token for a new access token without checking the
+        password. With rotation on, the refresh token is spent and replaced.
+        """
+        access_token, refresh_token = rotate(get_jwt())
+        response = {"access_token": access_token}
+        if refresh_token is not None:
+            response["refresh_token"] = refresh_token
+        return response, 200
+
+
 @blp.route("/logout")
 class UserLogout(MethodView):
     @jwt_required()
     def post(self):
         # logger.info("Logout POST method accessed")
         try:
-            jti = get_jwt()["jti"]
-            BLOCKLIST.add(jti)
+            token = get_jwt()
+            expires_at = datetime.datetime.utcfromtimestamp(token["exp"]) if "exp" in token else None
+            BLOCKLIST.add(token["jti"], expires_at)
+            revoke_session(token)
             # logger.info("User logged out successfully")
             return {"message": "Successfully logged out"}, 200
         except Exception as e:
@@ -96,9 +134,10 @@ class StudentRegister(MethodView):
     def post(self, mem_data):
         if not mongo.db.students.find_one({"email": mem_data["email"]}):
             mem_data["created_at"] = datetime.datetime.now()
-            mem_data["password"] = pbkdf2_sha256.hash(mem_data["password"])
+            mem_data["password"] = PASSWORD_HASHER.hash(mem_data["password"])
             student_id = mongo.db.students.insert_one(mem_data).inserted_id
-            student_id = json.loads(json_util.dumps(student_id))
+            RESPONSE_CACHE.bump("students")
+            student_id = to_json(student_id)
             return {"message": "Member registered", "id": student_id}
         return {"message": "email already exists"}
 
@@ -115,9 +154,49 @@ class StaffRegister(MethodView):
         if re.match(".*@.*staff.*", mem_data["email"]):
             if not mongo.db.staff.find_one({"email": mem_data["email"]}):
                 mem_data["created_at"] = datetime.datetime.now()
-                mem_data["password"] = pbkdf2_sha256.hash(mem_data["password"])
+                mem_data["password"] = PASSWORD_HASHER.hash(mem_data["password"])
                 staff_id = mongo.db.staff.insert_one(mem_data).inserted_id
-                staff_id = json.loads(json_util.dumps(staff_id))
+                ROLE_CACHE.invalidate(staff_id)
+                RESPONSE_CACHE.bump("staff")
+                staff_id = to_json(staff_id)
                 return {"message": "Member registered", "id": staff_id}
             return {"message": "email already exists"}
         return {"message": "Invalid email"}
+
+
+def import_upload(kind):
+    """
+    Import the rows of the request body, or of its `file` upload, as `kind`.
+    """
+    upload = request.files.get("file")
+    if upload is not None:
+        stream, fmt = upload.stream, detect_format(upload.filename, upload.mimetype)
+    else:
+        stream, fmt = request.stream, detect_format(content_type=request.mimetype)
+    fmt = request.args.get("format", fmt)
+    if fmt not in FORMATS:
+        abort(400, message=f"Unsupported format, use one of {', '.join(FORMATS)}.")
+    report = import_members(mongo.db, kind, read_rows(stream, fmt), current_app.config["IMPORT_CHUNK_SIZE"])
+    return {"message": "Import finished", **report}
+
+
+@blp.route("/register/student/import")
+class StudentImport(MethodView):
+    @jwt_required()
+    @authorize(permission="staff")
+    def post(self):
+        """
+        Register students from a CSV or NDJSON upload, streamed in chunks.
+        """
+        return import_upload("students")
+
+
+@blp.route("/register/staff/import")
+class StaffImport(MethodView):
+    @jwt_required()
+    @authorize(permission="admin")
+    def post(self):
+        """
+        Register staff from a CSV or NDJSON upload, streamed in chunks.
+        """
+        return import_upload("staff")
@@ -0,0 +1,71 @@
+import datetime
+import json
+import math
+from bson import ObjectId, json_util
+
+
+def _encode_datetime(value):
+    """
+    Encode a datetime the way json_util does in relaxed mode.
+
+    Naive datetimes coming out of PyMongo are UTC, which is the common case and
+    is handled inline; anything else falls back to json_util.
+    """
+    if value.tzinfo is None and value.year >= 1970:
+        millis = value.microsecond // 1000
+        fraction = f".{millis:03d}" if millis else ""
+        return {"$date": f"{value.isoformat(timespec='seconds')}{fraction}Z"}
+    return json_util.default(value)
+
+
+def _encode_special_float(value):
+    """
+    Encode NaN and +/-Infinity as json_util does, since JSON has no literal for them.
+    """
+    if math.isnan(value):
+        return {"$numberDouble": "NaN"}
+    return {"$numberDouble": "Infinity" if value > 0 else "-Infinity"}
+
+
+def to_json(value):
+    """
+    Convert a BSON document (or any value inside one) into JSON-ready values.
+
+    The output is the same as json.loads(json_util.dumps(value)) but is built in
+    a single walk over the document instead of encoding to a string and parsing
+    it back.
+
+    Args:
+        value: A document, a list of documents, or a single BSON value.
+
+    Returns:
+        Plain dicts, lists and scalars that any JSON encoder accepts.
+    """
+    kind = type(value)
+    if kind is str or kind is int or kind is bool or value is None:
+        return value
+    if kind is float:
+        return value if math.isfinite(value) else _encode_special_float(value)
+    if kind is dict:
+        return {key: to_json(item) for key, item in value.items()}
+    if kind is list:
+        return [to_json(item) for item in value]
+    if kind is ObjectId:
+        return {"$oid": str(value)}
+    if kind is datetime.datetime:
+        return _encode_datetime(value)
+    if isinstance(value, int):
+        # bson.Int64, which PyMongo returns for integers beyond 32 bits.
+        return int(value)
+    if hasattr(value, "items"):
+        return {key: to_json(item) for key, item in value.items()}
+    if hasattr(value, "__iter__") and not isinstance(value, (str, bytes)):
+        return [to_json(item) for item in value]
+    return to_json(json_util.default(value))
+
+
+def dumps(value):
+    """
+    Serialize a BSON document straight to a JSON string.
+    """
+    return json.dumps(to_json(value))
@@ -0,0 +1,123 @@
+"""
+Production entry point.
+
+    python serve.py --server gevent --workers 4 --connections 200
+    python serve.py --server waitress --threads 16
+
+gevent runs `workers` pre-forked processes sharing one listening socket, each
+serving up to `connections` concurrent greenlets. waitress runs a single
+process with `threads` request threads. Unless MONGO_MAX_POOL_SIZE is set, the
+PyMongo pool of each process is sized to that process's concurrency.
+"""
+import argparse
+import os
+import signal
+import sys
+from dotenv import load_dotenv
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the college ERP API.")
+    parser.add_argument("--server", choices=("gevent", "waitress"), default=os.environ.get("SERVER", "gevent"))
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", 1)),
+                        help="gevent: number of pre-forked worker processes")
+    parser.add_argument("--connections", type=int, default=int(os.environ.get("WORKER_CONNECTIONS", 100)),
+                        help="gevent: concurrent requests per worker")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("THREADS", 8)),
+                        help="waitress: number of request threads")
+    return parser.parse_args()
+
+
+def warm_up(app):
+    from db import warm_up_pool
+    from log_services.logger import get_logger
+
+    logger = get_logger(__name__)
+
+    try:
+        warm_up_pool(app.config["MONGO_MIN_POOL_SIZE"])
+    except Exception as e:
+        logger.error("MongoDB pool warm-up failed: %s", e)
+    else:
+        logger.info("Warmed up the MongoDB pool of worker %s", os.getpid())
+
+
+def serve_gevent(args):
+    from gevent import monkey
+    monkey.patch_all()
+
+    import gevent
+    import socket
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+
+    os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(args.connections))
+    if args.workers > 1:
+        # Workers must see each other's cache and role invalidations.
+        os.environ.setdefault("RESPONSE_CACHE_BACKEND", "shared")
+        if os.environ["RESPONSE_CACHE_BACKEND"] != "shared":
+            # Without it a demoted admin keeps access on the other workers
+            # until their entry expires, so keep that window short.
+            os.environ["ROLE_CACHE_TTL"] = str(min(float(os.environ.get("ROLE_CACHE_TTL", 60)), 5))
+    from app import app
+    from attendance_buffer import ATTENDANCE_BUFFER
+    from db import mongo, client_options
+    from log_services.logger import use_worker_log
+
+    listener = socket.create_server((args.host, args.port), backlog=2048)
+    # Connections opened while importing the app (index sync) must not be
+    # shared with the forked workers, so every process builds its own client.
+    mongo.cx.close()
+
+    children, index = [], 0
+    for worker in range(1, max(args.workers, 1)):
+        pid = os.fork()
+        if pid == 0:
+            children, index = [], worker
+            break
+        children.append(pid)
+    if args.workers > 1:
+        use_worker_log(index, forked=index > 0)
+
+    mongo.init_app(app, **client_options(app.config))
+    warm_up(app)
+    server = WSGIServer(listener, app, spawn=Pool(args.connections))
+    # Stop serving on SIGTERM, which the parent also sends its workers, so that
+    # buffered attendance writes are flushed before the process exits.
+    gevent.signal_handler(signal.SIGTERM, server.stop)
+    try:
+        server.serve_forever()
+    finally:
+        ATTENDANCE_BUFFER.close()
+        for pid in children:
+            try:
+                os.kill(pid, 15)
+            except OSError:
+                pass
+
+
+def serve_waitress(args):
+    import waitress
+
+    os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(args.threads))
+    from app import app
+
+    warm_up(app)
+    # Exit through SystemExit on SIGTERM so the atexit flush of buffered attendance writes runs.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    waitress.serve(app, host=args.host, port=args.port, threads=args.threads)
+
+
+def main():
+    load_dotenv()
+    args = parse_args()
+    if args.server == "gevent":
+        serve_gevent(args)
+    else:
+        serve_waitress(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
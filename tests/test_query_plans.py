@@ -0,0 +1,54 @@
+"""
+Check that the GET /student filters are served by their indexes on a real
+mongod. Skipped unless MONGO_URL is set; the test creates and drops its own
+scratch collection in that database.
+
+    MONGO_URL=mongodb://localhost:27017/erp_test python -m pytest tests
+"""
+import os
+import pytest
+
+pytestmark = pytest.mark.skipif(not os.environ.get("MONGO_URL"), reason="MONGO_URL is not set")
+
+PAGE_LIMIT = 51  # PAGE_SIZE_DEFAULT + 1, as paginate() asks for
+
+
+@pytest.fixture(scope="module")
+def students():
+    from pymongo import MongoClient
+    from indexes import INDEXES
+
+    client = MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=5000)
+    collection = client.get_default_database("erp")["query_plan_students"]
+    collection.drop()
+    collection.create_indexes(INDEXES["students"])
+    collection.insert_many([
+        {
+            "email": f"student{i}@college.student.in",
+            "name": f"{chr(ord('A') + i % 26)}{chr(ord('a') + i // 26 % 26)}student {i}",
+            "dept": f"D{i % 20}",
+            "batch": 2020 + i % 4,
+            "sem": 1 + i % 8,
+        }
+        for i in range(4000)
+    ])
+    yield collection
+    collection.drop()
+    client.close()
+
+
+@pytest.mark.parametrize("args, index", [
+    ({"dept": "D3"}, "dept_batch_sem_id"),
+    ({"dept": "D3", "batch": 2023}, "dept_batch_sem_id"),
+    ({"dept": "D3", "batch": 2023, "sem": 4}, "dept_batch_sem_id"),
+    ({"name": "Bc"}, "name_id"),
+])
+def test_student_filter_uses_its_index(students, args, index):
+    from indexes import explain_stages
+    from routes.student import student_filter
+
+    # The same shape as a GET /student page: keyset order on _id, limit + 1.
+    cursor = students.find(student_filter(args)).sort("_id", 1).limit(PAGE_LIMIT)
+    stages = explain_stages(cursor)
+    assert ("IXSCAN", index) in stages, stages
+    assert not any(stage == "COLLSCAN" for stage, _ in stages), stages